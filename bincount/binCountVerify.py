@@ -1,5 +1,8 @@
 from numpy import searchsorted, ravel, array, abs
 from numpy import float64, zeros, ones, linspace
+
+from catalogParser import readColumns
+
 def binRange(minval, maxval, levels):
 	expos = linspace(0, 1, levels)[1:]
 	return (minval*((maxval/minval)**expos))
@@ -17,12 +20,7 @@ def distanceParser(input_file):
 	<z> value for this task is alway 1 so we ignore it
 	it reads the angle form and we should return radian form
 	"""
-	ras, decs = list(), list()
-	for line in input_file:
-		ra, dec, _ = map(float, line.split())
-		ras.append(ra)
-		decs.append(dec)
-	return array(ras, dtype=float64), array(decs, dtype=float64)
+	return readColumns(input_file, (0, 1))
 
 def distance(group1, group2):
 	m, n = group1.size, group2.size
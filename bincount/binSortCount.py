@@ -1,5 +1,7 @@
 from numpy import array, diff, linspace, searchsorted, reshape, arange
-from numpy import ones, array_str, zeros
+from numpy import ones, array_str, zeros, column_stack
+
+from catalogParser import readColumns
 
 def decomposeRange(low, high):
 	i = 0
@@ -71,13 +73,8 @@ def distanceParser(input_name):
 	<z> value for this task is alway 1 so we ignore it
 	it reads the angle form and we should return radian form
 	"""
-	data = list()
-	with open(input_name) as inputfile:
-		for line in inputfile:
-			ra, dec, _ = map(float, line.split())
-			data.append(ra)
-			data.append(dec)
-	return array(data, dtype="float64")
+	ras, decs = readColumns(input_name, (0, 1))
+	return column_stack((ras, decs)).ravel()
 
 if __name__ == '__main__':
 	import sys
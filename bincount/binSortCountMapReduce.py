@@ -1,16 +1,28 @@
 import json
 import numpy
-from numpy import searchsorted, ravel, array, abs, ceil
-from numpy import float64, zeros, ones, linspace, array_split
+from numpy import searchsorted, ravel, abs, ceil
+from numpy import zeros, ones, linspace, array_split
 import base64
 
-def split_data(ras, decs):
+try:
+	from blockSize import autoBlockSize
+	from catalogParser import readColumns
+except ImportError:
+	# imported as the bincount package, e.g. from the repository root
+	from .blockSize import autoBlockSize
+	from .catalogParser import readColumns
+
+def split_data(ras, decs, blockSize=256, memoryLimit=None, threads=1):
 	"""
 	It will split the RAs and DECs into smaller chunks which would be better
 	for cache coherent
+	blockSize="auto" benchmarks the reducer kernel once per host to choose it,
+	see blockSize.autoBlockSize for memoryLimit and threads
 	"""
-	size = ceil(len(ras)/256.0)
-	return zip(array_split(ras, size), array_split(decs, size))
+	if blockSize == "auto":
+		blockSize = autoBlockSize(reducerKernel, 64, memoryLimit, threads)
+	size = ceil(len(ras)/float(blockSize))
+	return list(zip(array_split(ras, size), array_split(decs, size)))
 
 def addCount(count, value0, value1, bin_range):
 	x = searchsorted(bin_range, value0)
@@ -29,12 +41,7 @@ def distanceParser(input_file):
 	<z> value for this task is alway 1 so we ignore it
 	it reads the angle form and we should return radian form
 	"""
-	ras, decs = list(), list()
-	for line in input_file:
-		ra, dec, _ = map(float, line.split())
-		ras.append(ra)
-		decs.append(dec)
-	return array(ras, dtype=float64), array(decs, dtype=float64)
+	return readColumns(input_file, (0, 1))
 
 def distance(group1, group2):
 	m, n = group1.size, group2.size
@@ -48,13 +55,18 @@ def distance(group1, group2):
 
 	return ravel(abs(d1-d2))
 
+def reducerKernel(group1, group2):
+	"""
+	the work the reducer does on a pair of groups, used to tune split_data
+	"""
+	return distance(group1[0], group2[0]), distance(group1[1], group2[1])
 
 def pointsPairsToJson(ra1, dec1, ra2, dec2):
 	data = dict()
-	data["ra1"] = base64.b64encode(ra1)
-	data["ra2"] = base64.b64encode(ra2)
-	data["dec1"] = base64.b64encode(dec1)
-	data["dec2"] = base64.b64encode(dec2)
+	data["ra1"] = base64.b64encode(ra1).decode("ascii")
+	data["ra2"] = base64.b64encode(ra2).decode("ascii")
+	data["dec1"] = base64.b64encode(dec1).decode("ascii")
+	data["dec2"] = base64.b64encode(dec2).decode("ascii")
 	return json.dumps(data)
 
 
@@ -73,22 +85,23 @@ def reducer(input_file, output_file):
 	addcount = lambda x,y:addCount(counter, x, y, bin_range)
 	for line in input_file:
 		data = json.loads(line)
-		ra1 = numpy.frombuffer(base64.decodestring(data["ra1"]))
-		ra2 = numpy.frombuffer(base64.decodestring(data["ra2"]))
-		dec1 = numpy.frombuffer(base64.decodestring(data["dec1"]))
-		dec2 = numpy.frombuffer(base64.decodestring(data["dec2"]))
+		ra1 = numpy.frombuffer(base64.b64decode(data["ra1"]))
+		ra2 = numpy.frombuffer(base64.b64decode(data["ra2"]))
+		dec1 = numpy.frombuffer(base64.b64decode(data["dec1"]))
+		dec2 = numpy.frombuffer(base64.b64decode(data["dec2"]))
 		ras = distance(ra1, ra2)
 		decs = distance(dec1, dec2)
-		map(addcount, ras, decs)
+		for x, y in zip(ras, decs):
+			addcount(x, y)
 	counter = ravel(counter)
-	output_file.write(base64.b64encode(counter))
+	output_file.write(base64.b64encode(counter).decode("ascii"))
 	output_file.write("\n")
 
 def combiner(input_file, output_file):
 	bin_range = binRange(2/3600.0, 1.0, 5)
 	counter = zeros(bin_range.size*bin_range.size, dtype="int64")
 	for line in input_file:
-		data = numpy.frombuffer(base64.decodestring(line), dtype="int64")
+		data = numpy.frombuffer(base64.b64decode(line), dtype="int64")
 		counter += data
 	counter.shape = (bin_range.size, bin_range.size)
 	output_file.write(str(counter.tolist()))
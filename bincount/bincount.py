@@ -1,9 +1,17 @@
 from numpy import log, floor, abs, bincount, array_split, int64
 from numpy import sin, cos, arcsin, radians, sqrt
-from numpy import ones, array, zeros, float64, ravel, minimum, maximum, add, concatenate
+from numpy import ones, zeros, ravel, minimum, maximum, add
+from numpy import dtype, frombuffer, float32, finfo, newaxis, rint, flatnonzero
+import numpy
 from math import ceil
 
-import matplotlib.pyplot as plt
+try:
+	from blockSize import autoBlockSize
+	from catalogParser import readColumns
+except ImportError:
+	# imported as the bincount package, e.g. from the repository root
+	from .blockSize import autoBlockSize
+	from .catalogParser import readColumns
 
 
 ### It is a simple classifier for distance based on logorithm magnitude
@@ -11,8 +19,10 @@ import matplotlib.pyplot as plt
 ###	             >> bin.distance(300.0)
 class Bin(object):
 	def __init__(self, maxbin=36000, minbin=2, binNum=30):
-		self.offset = log(minbin)
-		self.size = log(maxbin/minbin)
+		self.maxbin = float(maxbin)
+		self.minbin = float(minbin)
+		self.offset = log(self.minbin)
+		self.size = log(self.maxbin/self.minbin)
 		self.binNum = binNum
 		self.counter = zeros(binNum+1, dtype=int64)
 	
@@ -31,10 +41,25 @@ class Bin(object):
 		then add the result to bins
 		then accumulate the count result to the bin
 		"""
-		count_result = bincount(self.getBin(distances))
-		print len(count_result)
-		count_result = concatenate((count_result, zeros(self.binNum+1-len(count_result), dtype=int)))
-		self.counter += count_result
+		self.counter += bincount(self.getBin(distances), minlength=self.binNum+1)
+
+	def config(self):
+		"""
+		the edge configuration, two bins can only be merged if it is the same
+		"""
+		return (self.maxbin, self.minbin, self.binNum)
+
+	def merge(self, other):
+		"""
+		accumulate the counter of other into self, and return self
+		"""
+		if self.config() != other.config():
+			raise ValueError("cannot merge bins of configuration %s and %s"%(self.config(), other.config()))
+		self.counter += other.counter
+		return self
+
+	def __iadd__(self, other):
+		return self.merge(other)
 
 	def __add__(self, other):
 		"""
@@ -42,7 +67,48 @@ class Bin(object):
 		and it will create a newbin and add the counter together
 		"""
 		newbin = Bin(self.maxbin, self.minbin, self.binNum)
-		newbin.counter = self.counter+other.counter
+		newbin.counter += self.counter
+		return newbin.merge(other)
+
+	@staticmethod
+	def recordType(binNum):
+		return dtype([("maxbin", "<f8"), ("minbin", "<f8"), ("binNum", "<i8"),
+			("counter", "<i8", (binNum+1,))])
+
+	def toRecord(self):
+		"""
+		pack the edge configuration and the counter into a single numpy record,
+		it can be saved with numpy.save
+		"""
+		record = zeros(1, dtype=Bin.recordType(self.binNum))
+		record["maxbin"], record["minbin"], record["binNum"] = self.config()
+		record["counter"][0] = self.counter
+		return record
+
+	def toBuffer(self):
+		"""
+		the compact binary form, binNum followed by the toRecord bytes
+		"""
+		return int64(self.binNum).astype("<i8").tobytes()+self.toRecord().tobytes()
+
+	@staticmethod
+	def fromRecord(record):
+		record = record.ravel()[0]
+		newbin = Bin(record["maxbin"], record["minbin"], int(record["binNum"]))
+		newbin.counter += record["counter"]
+		return newbin
+
+	@staticmethod
+	def fromBuffer(data):
+		binNum = int(frombuffer(data[:8], dtype="<i8")[0])
+		return Bin.fromRecord(frombuffer(data[8:], dtype=Bin.recordType(binNum)))
+
+	def save(self, outfile):
+		numpy.save(outfile, self.toRecord())
+
+	@staticmethod
+	def load(infile):
+		return Bin.fromRecord(numpy.load(infile))
 
 
 def distanceParser(input_name):
@@ -52,21 +118,22 @@ def distanceParser(input_name):
 	<z> value for this task is alway 1 so we ignore it
 	it reads the angle form and we should return radian form
 	"""
-	ras, decs = list(), list()
-	with open(input_name) as inputfile:
-		for line in inputfile:
-			ra, dec, _ = map(float, line.split())
-			ras.append(ra)
-			decs.append(dec)
-	return radians(array(ras, dtype=float64)), radians(array(decs, dtype=float64))
-
-def split_data(ras, decs):
+	ras, decs = readColumns(input_name, (0, 1))
+	return radians(ras), radians(decs)
+
+def split_data(ras, decs, blockSize=2048, memoryLimit=None, threads=1, mybin=None, scale=1.0):
 	"""
 	It will split the RAs and DECs into smaller chunks which would be better
 	for cache coherent
+	blockSize="auto" benchmarks countPair, with the edges of mybin (a default
+	Bin if None) and scale, once per host to choose it, see
+	blockSize.autoBlockSize for memoryLimit and threads
 	"""
-	size = ceil(len(ras)/2048.0)
-	return zip(array_split(ras, size), array_split(decs, size))
+	if blockSize == "auto":
+		kernel = countKernel(Bin() if mybin is None else Bin(*mybin.config()), scale)
+		blockSize = autoBlockSize(kernel, 40, memoryLimit, threads, name="%s.countPair"%__name__)
+	size = ceil(len(ras)/float(blockSize))
+	return list(zip(array_split(ras, size), array_split(decs, size)))
 
 def distancePair(group0, group1):
 	"""
@@ -96,9 +163,91 @@ def distancePair(group0, group1):
 	deltaRA = 0.5*(ra0-ra1)
 	deltaDEC = 0.5*(dec0-dec1)
 
-	angles = 2*(arcsin(minimum(1.0, sqrt(sin(deltaDEC)**2)+(cos_dec0*cos_dec1)*sin(deltaRA)**2)))
+	angles = 2*(arcsin(minimum(1.0, sqrt(sin(deltaDEC)**2+(cos_dec0*cos_dec1)*sin(deltaRA)**2))))
 	return ravel(abs(angles))
 
+def distanceIndexed(group0, group1, index0, index1):
+	"""
+	distancePair for the pairs (index0[k], index1[k]) only, the values are
+	computed exactly the same way as distancePair does
+	"""
+	ra0, dec0 = ravel(group0[0])[index0], ravel(group0[1])[index0]
+	ra1, dec1 = ravel(group1[0])[index1], ravel(group1[1])[index1]
+
+	deltaRA = 0.5*(ra0-ra1)
+	deltaDEC = 0.5*(dec0-dec1)
+
+	angles = 2*(arcsin(minimum(1.0, sqrt(sin(deltaDEC)**2+(cos(dec0)*cos(dec1))*sin(deltaRA)**2))))
+	return abs(angles)
+
+def distancePair32(group0, group1):
+	"""
+	float32 version of distancePair, which moves half of the memory and does
+	twice as many values per SIMD instruction. It returns the angles together
+	with an upper bound of their absolute error. The RAs and DECs are centred
+	in float64 first, so the error of the differences is eps32 times the
+	largest centred coordinate rather than eps32 times 2*pi.
+	"""
+	ra0, dec0 = ravel(group0[0]), ravel(group0[1])
+	ra1, dec1 = ravel(group1[0]), ravel(group1[1])
+
+	ra_ref = 0.5*(min(ra0.min(), ra1.min())+max(ra0.max(), ra1.max()))
+	dec_ref = 0.5*(min(dec0.min(), dec1.min())+max(dec0.max(), dec1.max()))
+	ra0, ra1 = (ra0-ra_ref).astype(float32), (ra1-ra_ref).astype(float32)
+	dec0, dec1 = (dec0-dec_ref).astype(float32), (dec1-dec_ref).astype(float32)
+	cos_dec0 = cos(dec0+float32(dec_ref))[:, newaxis]
+	cos_dec1 = cos(dec1+float32(dec_ref))[newaxis, :]
+
+	deltaRA = float32(0.5)*(ra0[:, newaxis]-ra1[newaxis, :])
+	deltaDEC = float32(0.5)*(dec0[:, newaxis]-dec1[newaxis, :])
+
+	haversine = minimum(float32(1.0), sin(deltaDEC)**2+(cos_dec0*cos_dec1)*sin(deltaRA)**2)
+	angles = float32(2)*arcsin(sqrt(haversine))
+
+	# input rounding (absolute), arithmetic rounding (relative) and the
+	# amplification of the arcsin close to antipodal pairs
+	largest = max(abs(ra0).max(), abs(ra1).max(), abs(dec0).max(), abs(dec1).max(), abs(dec_ref))
+	eps = finfo(float32).eps
+	errors = float32(4*eps*(largest+1))+float32(16*eps)*angles
+	errors += float32(8*eps)/sqrt(maximum(float32(1.0)-haversine, float32(eps)))
+	return ravel(angles), ravel(errors)
+
+def countKernel(mybin, scale=1.0):
+	"""
+	the work of the main loop on a pair of groups, countPair into mybin, used
+	to tune split_data. Its peak memory is about 33 bytes per pair.
+	"""
+	def kernel(group0, group1):
+		countPair(group0, group1, mybin, scale)
+	return kernel
+
+def countPair(group0, group1, mybin, scale=1.0):
+	"""
+	mixed precision version of mybin.count(distancePair(group0, group1)*scale),
+	it gives exactly the same counts. All the pairs are binned from the float32
+	kernel, and only the pairs whose float32 angle is within its error bound of
+	a bin edge are recomputed in float64.
+	"""
+	# self pairs have zero angles, whose logs are -inf and are binned from
+	# the float64 fallback
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		angles, errors = distancePair32(group0, group1)
+		eps = finfo(float32).eps
+		perLog = float32(mybin.binNum/mybin.size)
+
+		logs = log(angles*float32(scale))
+		position = (logs-float32(mybin.offset))*perLog
+		slack = (errors/angles+float32(8*eps)*(abs(logs)+float32(abs(mybin.offset))+float32(1)))*perLog
+		near = (abs(position-rint(position)) <= slack) | (angles <= errors)
+
+		fallback = flatnonzero(near)
+		n = ravel(group1[0]).size
+		exact = distanceIndexed(group0, group1, fallback//n, fallback%n)*scale
+
+		mybin.counter += bincount(mybin.limit(position[~near]).astype(int), minlength=mybin.binNum+1)
+		mybin.counter += bincount(mybin.getBin(exact), minlength=mybin.binNum+1)
+	return fallback.size
+
 
 if __name__ == '__main__':
 	import sys
@@ -115,8 +264,7 @@ if __name__ == '__main__':
 		i += 1
 		for group1 in groups:
 			j += 1
-			distances = distancePair(group0, group1)*36000
-			mybin.count(distances)
+			countPair(group0, group1, mybin, 36000)
 			print("finished grid %d, %d"%(i,j))
 	for i in range(30):
 		print("bin:%d number:%d"%(i, mybin.counter[i]))
@@ -0,0 +1,127 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+from time import time
+from numpy import pi, sqrt
+from numpy.random import uniform
+
+### Automatic block size for split_data.
+### A short micro benchmark times the pair kernel on square blocks of every
+### candidate size that fits the memory cap, and the size that gives the most
+### pairs per second wins. The choice is cached per host in cacheFile, so the
+### benchmark only runs once on each machine, and for each kernel. By default
+### the cache is blocksize.json in the directory of the comoving distance
+### tables (COSMO_CACHE_DIR, or ~/.cache/cosmo).
+### example usage>> size = autoBlockSize(distancePair, bytesPerPair=96)
+
+CANDIDATES = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+def defaultCacheFile():
+	return os.path.join(os.environ.get("COSMO_CACHE_DIR") or
+		os.path.join(os.path.expanduser("~"), ".cache", "cosmo"), "blocksize.json")
+
+def memoryBudget(fraction=0.25):
+	"""
+	a fraction of the physical memory, or 1GB if it can not be found
+	"""
+	try:
+		return int(fraction*os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_PHYS_PAGES"))
+	except (ValueError, OSError, AttributeError):
+		return 1<<30
+
+def randomGroup(size):
+	"""
+	a (RAs, DECs) group of random positions in radians
+	"""
+	return uniform(0, 2*pi, size), uniform(-0.5*pi, 0.5*pi, size)
+
+def pairRate(kernel, size, threads=1, minTime=0.05):
+	"""
+	pairs per second of kernel on size x size blocks, with threads blocks
+	being processed at the same time
+	"""
+	groups = [(randomGroup(size), randomGroup(size)) for _ in range(threads)]
+	def work(group0, group1, repeats):
+		for _ in range(repeats):
+			kernel(group0, group1)
+
+	repeats, elapsed = 1, 0.0
+	while elapsed < minTime:
+		workers = [threading.Thread(target=work, args=(group0, group1, repeats)) for group0, group1 in groups]
+		start = time()
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		elapsed = time()-start
+		repeats *= 2
+	return threads*(repeats//2)*size*size/elapsed
+
+def readCache(cacheFile):
+	try:
+		with open(cacheFile) as infile:
+			return json.load(infile)
+	except (IOError, ValueError):
+		return dict()
+
+def writeCache(cacheFile, cache):
+	"""
+	write the cache to a temporary file and rename it, so that a process
+	reading it at the same time never sees a partial file
+	"""
+	directory = os.path.dirname(os.path.abspath(cacheFile))
+	temporary = None
+	try:
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		handle, temporary = tempfile.mkstemp(suffix=".json", dir=directory)
+		with os.fdopen(handle, "w") as outfile:
+			json.dump(cache, outfile, indent=1, sort_keys=True)
+		# mkstemp creates the file for its owner only
+		umask = os.umask(0)
+		os.umask(umask)
+		os.chmod(temporary, 0o666 & ~umask)
+		os.replace(temporary, cacheFile)
+	except (IOError, OSError):
+		print("ERROR: Could not write succesfully to %s"%cacheFile)
+		if temporary is not None and os.path.exists(temporary):
+			os.remove(temporary)
+
+def kernelName(kernel):
+	"""
+	the module qualified name of kernel, used as its key in the cache
+	"""
+	return "%s.%s"%(getattr(kernel, "__module__", None), getattr(kernel, "__name__", repr(kernel)))
+
+def autoBlockSize(kernel, bytesPerPair=96, memoryLimit=None, threads=1,
+		candidates=CANDIDATES, cacheFile=None, refresh=False, name=None):
+	"""
+	Pick the block size that maximizes the pairs per second of kernel.
+	kernel takes two (RAs, DECs) groups like distancePair. bytesPerPair is the
+	peak memory the kernel needs for each pair of a block, and every one of the
+	threads workers holds a block, so a size is only tried if
+	threads*size*size*bytesPerPair fits in memoryLimit.
+	The choice is cached under name, by default the module qualified name of
+	kernel; closures and partials should be given a name of their own.
+	cacheFile defaults to defaultCacheFile().
+	"""
+	if cacheFile is None:
+		cacheFile = defaultCacheFile()
+	if memoryLimit is None:
+		memoryLimit = memoryBudget()
+	key = "%s:%s:%d:%d:%d"%(socket.gethostname(), name or kernelName(kernel),
+		bytesPerPair, memoryLimit, threads)
+	cache = readCache(cacheFile)
+	if key in cache and not refresh:
+		return cache[key]
+
+	largest = int(sqrt(memoryLimit/float(threads*bytesPerPair)))
+	sizes = [size for size in candidates if size <= largest] or [max(largest, 1)]
+	rates = [(pairRate(kernel, size, threads), size) for size in sizes]
+	best = max(rates)[1]
+
+	cache[key] = best
+	writeCache(cacheFile, cache)
+	return best
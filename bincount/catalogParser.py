@@ -0,0 +1,16 @@
+from numpy import loadtxt, float64
+
+### Column parser for the bincount scripts.
+### It is the loadtxt based counterpart of common.catalogio.readColumns, kept
+### here so that the scripts only import their neighbours: they run from any
+### directory and can be shipped on their own (hadoop streaming -file).
+### example usage>> ras, decs = readColumns("points.txt", (0, 1))
+
+def readColumns(input_file, columns):
+	"""
+	reads the given columns of a text catalog, a file name (plain or .gz) or
+	an open file such as sys.stdin, skipping '#' comments, and returns one
+	contiguous float64 array per column
+	"""
+	table = loadtxt(input_file, dtype=float64, comments="#", usecols=tuple(columns), ndmin=2)
+	return tuple([table[:, index].copy() for index in range(len(columns))])
@@ -0,0 +1,158 @@
+from numpy import lexsort, searchsorted, cumsum, repeat, arange, concatenate, maximum
+from numpy import sin, cos, arcsin, sqrt, abs, minimum, where, pi, degrees, radians, finfo
+from math import ceil
+
+try:
+	from bincount import Bin, distanceParser
+except ImportError:
+	# imported as the bincount package, e.g. from the repository root
+	from .bincount import Bin, distanceParser
+
+### Declination strip sweep for angular pair counting.
+### The sky is cut into declination strips of height maxangle, and the sources
+### are sorted by strip and by RA inside each strip, so every partner of a source
+### lies in its own strip or in the next one up, within the RA half width of
+### the cap of radius maxangle around the source (with the cos(dec)
+### correction). These RA windows are found with a binary search, and only the
+### sources inside them go through the exact haversine formula, so apart from
+### the n log n sort and searches the work done is proportional to the number
+### of pairs within maxangle instead of n^2 (about two candidates per pair on a
+### uniform sky).
+### example usage>> mybin = Bin(maxbin=3600.0, minbin=2.0, binNum=30)
+###	             >> decStripCount(ras, decs, radians(1.0), mybin, 3600*degrees(1.0))
+
+def sortByStrip(ras, decs, maxangle):
+	"""
+	return the ras (wrapped into [0, 2pi)) and decs sorted by declination strip
+	and then by RA, the strip of each source, the index of the first source of
+	every strip (and the total after the last one) and the permutation that
+	has been applied to them
+	"""
+	ras = ras % (2*pi)
+	# tiny negative RAs round up to 2pi
+	ras[ras >= 2*pi] = 0.0
+	strips = max(int(ceil(pi/maxangle)), 1)
+	strip = minimum(((decs+0.5*pi)/maxangle).astype(int), strips-1)
+	strip[strip < 0] = 0
+	order = lexsort((ras, strip))
+	strip = strip[order]
+	return ras[order], decs[order], strip, searchsorted(strip, arange(strips+1)), order
+
+def raWidths(decs, cos_decs, maxangle):
+	"""
+	The half width in RA of a cap of radius maxangle centred at each declination,
+	which is asin(sin(maxangle)/cos(dec)). Caps that reach over a pole cover
+	every RA, so their width is pi. A tiny slack keeps the filter conservative.
+	"""
+	covered = (abs(decs)+maxangle) < 0.5*pi
+	ratio = sin(maxangle)/where(covered, cos_decs, 1.0)
+	widths = where(covered, arcsin(minimum(ratio, 1.0)), pi)
+	return widths*(1+1e-9)
+
+def haversine(ra0, dec0, cos_dec0, ra1, dec1, cos_dec1):
+	"""
+	element-wise version of Professor Brunner's hsAngularDistance, which is
+	exact at small separations (see pcsource.py)
+	"""
+	deltaRA = 0.5*(ra0-ra1)
+	deltaDEC = 0.5*(dec0-dec1)
+	return 2*arcsin(minimum(1.0, sqrt(sin(deltaDEC)**2+cos_dec0*cos_dec1*sin(deltaRA)**2)))
+
+def windows(ras, strip, starts, widths):
+	"""
+	The candidate partners of every source, as ranges of sorted sources: the
+	sources of its own strip that come after it and those of the next strip,
+	whose RA is within the width of the source. A window that wraps around RA
+	0 gives two ranges. Returns the source, first partner and number of
+	partners of every non empty range.
+	"""
+	strips = starts.size-1
+	index = arange(ras.size)
+
+	# the sources are searched by strip and RA at once, on the key
+	# strip*4pi+RA; the slack covers its rounding
+	keys = strip*(4*pi)+ras
+	slack = 8*finfo(keys.dtype).eps*(strips*4*pi)
+	whole = widths >= pi
+	low = where(whole, 0.0, ras-widths-slack)
+	high = where(whole, 2*pi, ras+widths+slack)
+
+	sources, firsts, counts = [], [], []
+	for step in (0, 1):
+		inside = index[strip+step < strips]
+		base = (strip[inside]+step)*(4*pi)
+		lo, hi = low[inside], high[inside]
+		# the window itself, the part below RA 0 and the part above 2pi
+		# (an empty range ends before it starts)
+		for a, b in ((maximum(lo, 0.0), minimum(hi, 2*pi)),
+			(where(lo < 0, lo+2*pi, 1.0), where(lo < 0, 2*pi, 0.0)),
+			(where(hi > 2*pi, 0.0, 1.0), where(hi > 2*pi, hi-2*pi, 0.0))):
+			first = searchsorted(keys, base+a, side="left")
+			last = searchsorted(keys, base+b, side="right")
+			if step == 0:
+				first = maximum(first, inside+1)
+			sources.append(inside)
+			firsts.append(first)
+			counts.append(last-first)
+
+	sources, firsts, counts = concatenate(sources), concatenate(firsts), concatenate(counts)
+	keep = counts > 0
+	return sources[keep], firsts[keep], counts[keep]
+
+def stripPairs(ras, decs, maxangle, maxPairs=1<<20):
+	"""
+	Generate the angular distances (in radians) of all the unique pairs whose
+	separation is not larger than maxangle. Pairs beyond maxangle are never
+	yielded, and neither are the self pairs.
+	At most maxPairs candidate pairs are held in memory at once.
+	"""
+	ras, decs, strip, starts, _ = sortByStrip(ras, decs, maxangle)
+	cos_decs = cos(decs)
+	widths = raWidths(decs, cos_decs, maxangle)
+	sources, firsts, counts = windows(ras, strip, starts, widths)
+	ends = cumsum(counts)
+	rows = counts.size
+
+	start = 0
+	while start < rows:
+		done = ends[start-1] if start > 0 else 0
+		stop = max(searchsorted(ends, done+maxPairs, side="right"), start+1)
+		total = ends[stop-1]-done
+		sizes = counts[start:stop]
+		i = repeat(sources[start:stop], sizes)
+		j = arange(total)-repeat(ends[start:stop]-sizes-done, sizes)+repeat(firsts[start:stop], sizes)
+
+		angles = haversine(ras[i], decs[i], cos_decs[i], ras[j], decs[j], cos_decs[j])
+		yield angles[angles <= maxangle]
+		start = stop
+
+def decStripDistances(ras, decs, maxangle, maxPairs=1<<20):
+	"""
+	all the distances of stripPairs in a single array
+	"""
+	return concatenate([angles for angles in stripPairs(ras, decs, maxangle, maxPairs)]+[ras[:0]])
+
+def decStripCount(ras, decs, maxangle, mybin, scale=1.0, maxPairs=1<<20):
+	"""
+	count every unique pair within maxangle into mybin, the distances are
+	multiplied by scale before binning so that they match the unit of the bin
+	"""
+	for angles in stripPairs(ras, decs, maxangle, maxPairs):
+		mybin.count(angles*scale)
+	return mybin
+
+
+if __name__ == '__main__':
+	import sys
+	RAs, DECs = distanceParser(sys.argv[1])
+	maxdegree = float(sys.argv[2])
+	try:
+		logfile = open(sys.argv[3], "w")
+	except:
+		logfile = sys.stdout
+
+	mybin = Bin(maxbin=maxdegree*3600, minbin=2, binNum=30)
+	decStripCount(RAs, DECs, radians(maxdegree), mybin, 3600*degrees(1.0))
+	for i in range(30):
+		print("bin:%d number:%d"%(i, mybin.counter[i]))
+		logfile.write("%d\n"%mybin.counter[i])
@@ -0,0 +1,446 @@
+# catalogio.py
+#
+# This file contains the bulk readers shared by the catalog loaders in
+# this package (createSources and friends). The bincount scripts keep
+# their own copy of readColumns (bincount/catalogParser.py), so that
+# they do not depend on the layout of the repository.
+#
+# Instead of splitting every line and calling float() on each column
+# in Python, the input is read in large blocks of lines, which are
+# parsed by NumPy in one call per block. Comment lines (starting with
+# '#') are skipped, only the requested columns are kept, and the
+# result is returned as one array per column.
+#
+
+import io
+import json
+import os
+import multiprocessing
+import warnings
+import numpy
+from gzip import GzipFile
+
+from .predicate import predicate
+
+chunkSize = 1 << 24 # Number of bytes of text parsed at once
+
+def openText(infile):
+    """
+
+    Opens a catalog for reading text. Names ending in .gz are read
+    through gzip, other names are opened as normal files, and anything
+    else is assumed to be an open file object already.
+
+    INPUTS: Filename or file object
+
+    OUTPUTS: The file object, and whether it was opened here (and so
+    should be closed by the caller)
+
+    """
+
+    if not isinstance(infile, str):
+        return (infile, False)
+
+    if infile.endswith(".gz"):
+        return (io.TextIOWrapper(GzipFile(infile, 'rb')), True)
+
+    return (open(infile), True)
+
+def iterLines(infile, size = None):
+    """
+
+    Generates the lines of a text catalog in blocks of roughly the
+    given size in bytes.
+
+    INPUTS: Filename (plain or .gz) or file object, block size in bytes
+
+    OUTPUTS: Generates lists of lines
+
+    """
+
+    input, opened = openText(infile)
+
+    try:
+        while True:
+            lines = input.readlines(size or chunkSize)
+
+            if not lines:
+                break
+
+            yield lines
+
+    finally:
+        if opened:
+            input.close()
+
+def parseLines(lines, columns):
+    """
+
+    Parses a list of lines with NumPy, keeping only the given columns.
+
+    INPUTS: List of lines, sequence of column ordinal numbers
+
+    OUTPUTS: A 2D array with one row per data line and one column per
+    requested column
+
+    """
+
+    with warnings.catch_warnings():
+        # An empty block is not an error, it simply gives no rows
+
+        warnings.simplefilter("ignore", UserWarning)
+
+        table = numpy.loadtxt(lines, usecols=columns, comments='#',
+                              ndmin=2, dtype=numpy.float64)
+
+    return table.reshape(-1, len(columns))
+
+def parseBlock(lines, columns, filterFunction = None):
+    """
+
+    Parses a block of lines into columns, after dropping the lines
+    rejected by the filter function.
+
+    INPUTS: List of lines, sequence of column ordinal numbers,
+    optional filter function or predicate (see predicate.py)
+
+    OUTPUTS: A tuple with one contiguous array per requested column
+
+    """
+
+    # Predicates are evaluated on the parsed block as a whole, after
+    # parsing the columns they need as well.
+
+    if isinstance(filterFunction, predicate):
+        needed = sorted(set(columns) | filterFunction.columns())
+
+        table = parseLines(lines, needed)
+        values = dict(zip(needed, table.T))
+
+        keep = filterFunction.evaluate(values)
+
+        return tuple([numpy.ascontiguousarray(values[column][keep]) for column in columns])
+
+    if filterFunction is not None:
+        lines = [line for line in lines if line.strip() and not line.startswith('#')
+                 and filterFunction(line.split())]
+
+    # Transposed so that every column is contiguous in memory
+
+    table = numpy.ascontiguousarray(parseLines(lines, columns).T)
+
+    return tuple(table)
+
+def iterColumns(infile, columns, filterFunction = None, size = None):
+    """
+
+    Reads a text catalog block by block.
+
+    INPUTS: Filename (plain or .gz) or file object, sequence of column
+    ordinal numbers, optional filter function called with the split
+    columns of each line (as for createSources) or predicate evaluated
+    on whole blocks, block size in bytes
+
+    OUTPUTS: Generates a tuple with one array per requested column for
+    every block of the file
+
+    """
+
+    columns = tuple([int(column) for column in columns])
+
+    for lines in iterLines(infile, size):
+        yield parseBlock(lines, columns, filterFunction)
+
+def rebatch(blocks, batchSize):
+    """
+
+    Regroups a sequence of column blocks of any length into blocks of
+    exactly batchSize rows (the last one may be shorter), so that the
+    memory held at any time does not depend on the input.
+
+    INPUTS: Iterable of tuples of column arrays, number of rows per
+    batch
+
+    OUTPUTS: Generates tuples of column arrays
+
+    """
+
+    pending = []
+    count = 0
+
+    for block in blocks:
+        pending.append(block)
+        count += len(block[0])
+
+        while count >= batchSize:
+            joined = [numpy.concatenate(column) for column in zip(*pending)]
+
+            yield tuple([column[:batchSize] for column in joined])
+
+            pending = [tuple([column[batchSize:] for column in joined])]
+            count -= batchSize
+
+    if count > 0:
+        yield tuple([numpy.concatenate(column) for column in zip(*pending)])
+
+def readColumns(infile, columns, filterFunction = None, size = None):
+    """
+
+    Reads whole columns of a text catalog.
+
+    INPUTS: As for iterColumns
+
+    OUTPUTS: A tuple with one contiguous float64 array per requested
+    column
+
+    """
+
+    blocks = list(iterColumns(infile, columns, filterFunction, size))
+
+    if not blocks:
+        return tuple([numpy.empty(0, dtype=numpy.float64) for column in columns])
+
+    return tuple([numpy.concatenate([block[index] for block in blocks])
+                  for index in range(len(columns))])
+
+# A text catalog can be parsed by a pool of processes. Plain files are
+# split into byte ranges that end on line boundaries, and each process
+# reads its own range. Compressed files and file objects can not be
+# reopened by the processes, so they are read here and the blocks of
+# lines are sent to the processes.
+
+def splitText(infile, size = None):
+    """
+
+    Splits a plain text file into byte ranges of roughly the given
+    size, each range starting at the beginning of a line.
+
+    INPUTS: Filename, range size in bytes
+
+    OUTPUTS: List of (start, stop) byte offsets
+
+    """
+
+    size = size or chunkSize
+    total = os.path.getsize(infile)
+
+    offsets = [0]
+
+    with open(infile, 'rb') as input:
+        while offsets[-1] < total:
+            input.seek(min(offsets[-1] + size, total))
+            input.readline()
+            offsets.append(min(input.tell(), total))
+
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def readRange(infile, start, stop):
+    """
+
+    Reads the lines of a plain text file between two byte offsets.
+
+    """
+
+    with open(infile, 'rb') as input:
+        input.seek(start)
+        text = input.read(stop - start)
+
+    return text.decode("utf-8").splitlines(True)
+
+def mapColumnsWorker(task):
+    function, columns, filterFunction, infile, lines = task
+
+    if infile is not None:
+        lines = readRange(infile, *lines)
+
+    return function(parseBlock(lines, columns, filterFunction))
+
+def mapColumns(infile, columns, function, processes = None, filterFunction = None, size = None):
+    """
+
+    Parses a text catalog in blocks on a pool of processes, and calls
+    a function on the columns of each block in the process that parsed
+    it.
+
+    INPUTS: Filename (plain or .gz) or file object, sequence of column
+    ordinal numbers, function taking a tuple of column arrays (it must be
+    picklable, so a module level function or a functools.partial of
+    one), number of processes (all the processors by default),
+    optional filter function (also picklable), block size in bytes
+
+    OUTPUTS: Generates the results of the function, in file order
+
+    """
+
+    columns = tuple([int(column) for column in columns])
+
+    if not isinstance(infile, str) or infile.endswith(".gz"):
+        tasks = ((function, columns, filterFunction, None, lines)
+                 for lines in iterLines(infile, size))
+    else:
+        tasks = ((function, columns, filterFunction, infile, byteRange)
+                 for byteRange in splitText(infile, size))
+
+    if processes == 1:
+        for task in tasks:
+            yield mapColumnsWorker(task)
+        return
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        for result in pool.imap(mapColumnsWorker, tasks):
+            yield result
+
+    finally:
+        pool.terminate()
+
+# The binary catalog format keeps every column as a contiguous array of
+# a fixed type, so that a catalog can be memory mapped with no parsing
+# at all, and without losing any precision. The file starts with the
+# magic string, the length of a JSON header describing the catalog
+# (class, number of sources, columns with their type and position, and
+# any other attributes such as the cosmology), the header itself and
+# then the columns, each one starting on a 64 byte boundary.
+
+binaryExtension = ".pcbin"
+binaryMagic = b"COSMOCAT"
+binaryAlignment = 64
+
+def isBinary(filename):
+    """
+
+    Returns True if the filename is that of a binary catalog.
+
+    """
+
+    return isinstance(filename, str) and filename.endswith(binaryExtension)
+
+def aligned(size):
+    return binaryAlignment * ((size + binaryAlignment - 1) // binaryAlignment)
+
+def writeBinary(outfile, names, values, attributes = None):
+    """
+
+    Writes columns to a binary catalog file.
+
+    INPUTS: Filename, sequence of column names, sequence of arrays of
+    the same length (one per name), dictionary of extra attributes to
+    store in the header (for example the class name or cosmology)
+
+    OUTPUTS: None
+
+    """
+
+    values = [numpy.asarray(value) for value in values]
+    count = len(values[0]) if values else 0
+
+    columns = []
+    offset = 0
+
+    for name, value in zip(names, values):
+        if len(value) != count:
+            raise ValueError("column %s has %d values instead of %d" % (name, len(value), count))
+
+        columns.append({"name": name, "dtype": value.dtype.newbyteorder('<').str, "offset": offset})
+        offset = aligned(offset + count * value.dtype.itemsize)
+
+    header = dict(attributes or {})
+    header.update({"version": 1, "count": count, "columns": columns})
+
+    text = json.dumps(header, sort_keys=True).encode("utf-8")
+    text += b" " * (aligned(len(binaryMagic) + 8 + len(text)) - len(binaryMagic) - 8 - len(text))
+
+    with open(outfile, 'wb') as output:
+        output.write(binaryMagic)
+        output.write(numpy.array([len(text)], dtype='<u8').tobytes())
+        output.write(text)
+
+        start = output.tell()
+
+        for column, value in zip(columns, values):
+            output.write(b"\0" * (start + column["offset"] - output.tell()))
+            numpy.ascontiguousarray(value, dtype=column["dtype"]).tofile(output)
+
+def readBinaryHeader(infile):
+    """
+
+    Reads the header of a binary catalog file.
+
+    INPUTS: Filename
+
+    OUTPUTS: The header dictionary, with the position of the first
+    column in the file added as dataOffset
+
+    """
+
+    with open(infile, 'rb') as input:
+        if input.read(len(binaryMagic)) != binaryMagic:
+            raise IOError("%s is not a binary catalog file" % infile)
+
+        length = int(numpy.frombuffer(input.read(8), dtype='<u8')[0])
+        header = json.loads(input.read(length).decode("utf-8"))
+
+    header["dataOffset"] = len(binaryMagic) + 8 + length
+
+    return header
+
+def readBinary(infile, mmap = True):
+    """
+
+    Reads the columns of a binary catalog file. By default the
+    columns are read-only memory maps, so nothing is read from the
+    disk until the values are used.
+
+    INPUTS: Filename, whether to memory map the columns (or read them
+    into memory)
+
+    OUTPUTS: The header dictionary, and a dictionary of column name to
+    array
+
+    """
+
+    header = readBinaryHeader(infile)
+    count = header["count"]
+
+    columns = {}
+
+    for column in header["columns"]:
+        dtype = numpy.dtype(column["dtype"])
+        offset = header["dataOffset"] + column["offset"]
+
+        if count == 0:
+            columns[column["name"]] = numpy.empty(0, dtype=dtype)
+
+        elif mmap:
+            columns[column["name"]] = numpy.memmap(infile, dtype=dtype, mode='r',
+                                                   offset=offset, shape=(count,))
+        else:
+            with open(infile, 'rb') as input:
+                input.seek(offset)
+                columns[column["name"]] = numpy.fromfile(input, dtype=dtype, count=count)
+
+    return (header, columns)
+
+def checkHeader(header, names, cd = None):
+    """
+
+    Verifies that a binary catalog header holds all the named columns
+    and, when a cosmology is given, that any precomputed distances in
+    the file were calculated with the same cosmological parameters.
+
+    INPUTS: Header dictionary, sequence of column names, optional
+    cdistance object
+
+    OUTPUTS: None, a ValueError is raised if the file does not match
+
+    """
+
+    missing = set(names) - set([column["name"] for column in header["columns"]])
+
+    if missing:
+        raise ValueError("binary catalog is missing the columns %s" % ", ".join(sorted(missing)))
+
+    if cd is not None and "cosmology" in header and header["cosmology"] != cd.parameters():
+        raise ValueError("binary catalog was computed for cosmology %s instead of %s" %
+                         (header["cosmology"], cd.parameters()))
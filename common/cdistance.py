@@ -4,18 +4,97 @@
 # A collection of cosmology distance calculations based on the details
 # presented in the unpublished paper by David Hogg, astro-ph/9905116
 #
+# The comoving distance integral is tabulated once per object, on a
+# fine redshift grid, so that the distances of whole arrays of
+# redshifts are obtained by interpolation instead of by a new
+# integration for every redshift. The distances of single redshifts
+# are also memoized, in a bounded cache shared by all the objects.
+#
+# The tables are saved in a cache directory (COSMO_CACHE_DIR, or
+# ~/.cache/cosmo by default), so that other processes with the same
+# cosmology simply memory map them instead of integrating again. There
+# is one file per cosmology, replaced when its table is extended, and
+# only the tableFiles most recently used files are kept. The directory
+# can be deleted at any time, the tables are simply built again.
+#
 
-from math import sqrt, pi
-from ..numeric.integrate import trapezoid
+from math import sqrt, pi, ceil, log
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+import numpy
+from numpy import arange, asarray, gradient
+from ..numeric.integrate import trapezoid, gaussLegendre
 
 class cdistance:
 
+    # The comoving distance table: its redshift step, the number of
+    # Gauss-Legendre points used to integrate each step, and the
+    # redshift it initially extends to (it is extended as needed).
+
+    tableStep = 1.0 / 256
+    tableOrder = 8
+    tableMax = 16.0
+    tableLimit = 1024.0 # Largest redshift the table is extended to (262144 steps)
+
+    # Whether the tables are saved to and loaded from the cache
+    # directory
+
+    persistTables = True
+    tableFiles = 16 # Number of saved tables kept in the cache directory
+
+    # The least recently used cache of single redshift distances, keyed
+    # on (om, ol, h0, z) so that it can be shared by all the objects,
+    # along with its statistics. The lock guards the cache, and the
+    # building of the tables, so an object such as pczsource.cd can be
+    # used by several threads at once.
+
+    cacheSize = 1 << 16
+    cache = OrderedDict()
+    cacheHits = 0
+    cacheMisses = 0
+    cacheLock = threading.RLock()
+
     def __init__(self, om = 0.3, ol = 0.7, h0 = 1.0):
         self.om = float(om)
         self.ol = float(ol)
         self.h0 = float(h0)
 
-        self.iRoutine = trapezoid(self.oneOverEvolution)
+        self.iRoutine = trapezoid(self.oneOverEvolutionArray, vectorized = True)
+
+        self.table = None
+
+    def parameters(self):
+        """Returns the cosmological parameters of this object, as
+        stored in the header of binary catalog files
+        
+        OUTPUTS: Dictionary of om, ol and h0
+        """
+        
+        return {"om": self.om, "ol": self.ol, "h0": self.h0}
+
+    def cacheInfo(cls):
+        """Returns the statistics of the distance cache
+        
+        OUTPUTS: Dictionary of hits, misses, the number of cached
+        distances (size) and the maximum number (maxSize)
+        """
+        
+        with cls.cacheLock:
+            return {"hits": cls.cacheHits, "misses": cls.cacheMisses,
+                    "size": len(cls.cache), "maxSize": cls.cacheSize}
+
+    def clearCache(cls):
+        """Empties the distance cache and resets its statistics"""
+        
+        with cls.cacheLock:
+            cls.cache.clear()
+            cls.cacheHits = 0
+            cls.cacheMisses = 0
+
+    cacheInfo = classmethod(cacheInfo)
+    clearCache = classmethod(clearCache)
           
     def evolution(self, z):
         """Calculates E(z) for a given redshift assuming standard 
@@ -42,41 +121,426 @@ class cdistance:
         
         return 1.0/self.evolution(float(z))
 
+    def oneOverEvolutionArray(self, z):
+        """Calculates 1.0/E(z) for a whole array of redshifts
+        
+        INPUTS: Array of redshifts
+        
+        OUTPUTS: Array of 1.0/E(z)
+        """
+        
+        return 1.0 / numpy.sqrt(self.om * (1.0 + asarray(z, dtype=numpy.float64))**3 + self.ol)
+
+    def buildTable(self, zMax):
+        """Tabulates the comoving distance integral from zero to at
+        least zMax, in steps of tableStep. All the steps are
+        integrated at once with a tableOrder point Gauss-Legendre rule
+        (see gaussLegendre.integrateMany) and summed, so the integral
+        at the grid points is exact to rounding. Between the grid
+        points the integral is given by a cubic Hermite interpolation
+        using the exact derivative 1/E(z), whose error is at most
+        h^4 / 384 max|(1/E)'''|, with h the step; this bound (in
+        h^{-1} Mpc) is kept in tableError, and is 3.3E-8 for the
+        default step and the concordance cosmology.
+        
+        INPUTS: Maximum redshift
+        
+        OUTPUTS: None
+        """
+        
+        # The table always extends to tableMax times a power of two,
+        # so that the saved tables can be reused
+        
+        if zMax > self.tableMax:
+            zMax = self.tableMax * 2**int(ceil(log(zMax / self.tableMax, 2)))
+        else:
+            zMax = self.tableMax
+        
+        step = self.tableStep
+        steps = max(1, int(ceil(zMax / step)))
+        
+        table = self.loadTable(steps)
+        
+        if table is None:
+            z = arange(steps + 1) * step
+            
+            chi = self.tableQuadrature().integrateMany(0.0, z)
+            
+            table = numpy.array([z, chi, self.oneOverEvolutionArray(z)])
+            
+            self.saveTable(table)
+        
+        z, chi, slopes = table
+        third = numpy.abs(gradient(gradient(gradient(slopes, step), step), step)).max()
+        
+        # The table is replaced in one assignment, so that other
+        # threads always see a consistent table
+
+        self.tableError = (3000.0 / self.h0) * step**4 / 384.0 * third
+        self.table = (z, chi, slopes)
+
+    def tableQuadrature(self):
+        """Returns the tableOrder point Gauss-Legendre rule used to
+        integrate the steps of the table"""
+        
+        return gaussLegendre(self.oneOverEvolutionArray, self.tableOrder, 1E-13, vectorized = True)
+
+    def tableDirectory():
+        """Returns the directory holding the saved comoving distance
+        tables: COSMO_CACHE_DIR if it is set, else ~/.cache/cosmo
+        """
+        
+        return os.environ.get("COSMO_CACHE_DIR") or \
+            os.path.join(os.path.expanduser("~"), ".cache", "cosmo")
+
+    def tableFile(self):
+        """Returns the name of the file of the comoving distance
+        table. The name holds all that determines the table but its
+        extent: om and ol (the integral does not depend on h0) and the
+        grid, so that a longer table replaces a shorter one.
+        
+        OUTPUTS: Filename
+        """
+        
+        return os.path.join(self.tableDirectory(), "dm_om%r_ol%r_step%r_order%d.npy" %
+                            (self.om, self.ol, self.tableStep, self.tableOrder))
+
+    def loadTable(self, steps):
+        """Memory maps a saved comoving distance table, and marks it
+        as recently used
+        
+        INPUTS: Number of steps needed
+        
+        OUTPUTS: The (3, n + 1) array of redshifts, integrals and
+        slopes, with n at least steps, or None if there is no such
+        table
+        """
+        
+        if not self.persistTables:
+            return None
+        
+        filename = self.tableFile()
+        
+        try:
+            table = numpy.load(filename, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            return None
+        
+        if table.ndim != 2 or table.shape[0] != 3 or table.shape[1] < steps + 1:
+            return None
+        
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        
+        return table
+
+    def saveTable(self, table):
+        """Saves a comoving distance table in the cache directory, in
+        place of any shorter table of the same cosmology, and removes
+        the least recently used tables beyond tableFiles. The table is
+        written to a temporary file, which is then renamed, so that
+        processes starting at the same time never load a partial
+        table. A cache directory that can not be written to is not an
+        error, the table is just not saved.
+        
+        INPUTS: The table
+        
+        OUTPUTS: None
+        """
+        
+        if not self.persistTables:
+            return
+        
+        filename = self.tableFile()
+        
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            
+            handle, temporary = tempfile.mkstemp(suffix=".npy", dir=os.path.dirname(filename))
+            
+            with os.fdopen(handle, 'wb') as output:
+                numpy.save(output, table)
+            
+            # mkstemp creates the file for its owner only, the table is
+            # given the usual permissions so that the other users of a
+            # shared cache directory can load it
+            
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temporary, 0o666 & ~umask)
+            
+            os.replace(temporary, filename)
+        
+        except (IOError, OSError):
+            return
+        
+        self.pruneTables(self.tableFiles)
+
+    def pruneTables(count = 0):
+        """Removes all but the count most recently used tables from
+        the cache directory (all of them by default)
+        
+        INPUTS: Number of tables to keep
+        
+        OUTPUTS: None
+        """
+        
+        directory = cdistance.tableDirectory()
+        
+        try:
+            names = [name for name in os.listdir(directory)
+                     if name.startswith("dm_") and name.endswith(".npy")]
+            
+            used = sorted([(os.path.getmtime(os.path.join(directory, name)), name)
+                           for name in names], reverse = True)
+        except OSError:
+            return
+        
+        for (mtime, name) in used[count:]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    tableDirectory = staticmethod(tableDirectory)
+    pruneTables = staticmethod(pruneTables)
+
+    def tableTo(self, zMax):
+        """Returns the comoving distance table, after building or
+        extending it if it does not reach zMax. The table is never
+        extended beyond tableLimit, the number of steps (and the
+        memory used) would grow without bound with the redshift.
+        
+        INPUTS: Maximum redshift
+        
+        OUTPUTS: The tuple of the redshifts, integrals and slopes of
+        the table
+        """
+        
+        if zMax > self.tableLimit:
+            raise ValueError("redshift %g beyond the largest tabulated redshift (tableLimit = %g)" %
+                             (zMax, self.tableLimit))
+        
+        table = self.table
+        
+        if table is None or zMax > table[0][-1]:
+            with self.cacheLock:
+                table = self.table
+                
+                if table is None or zMax > table[0][-1]:
+                    previous = 0.0 if table is None else table[0][-1]
+                    
+                    self.buildTable(max(zMax, self.tableMax, 2.0 * previous))
+                    table = self.table
+        
+        return table
+
+    def comovingIntegral(self, z):
+        """Calculates the integral of 1/E from zero to each redshift
+        of an array, by interpolation in the comoving distance table
+        (see buildTable), which is built or extended when needed up
+        to tableLimit. Negative redshifts are integrated directly, and
+        beyond tableLimit the integral from its end is added.
+        
+        INPUTS: Array of redshifts
+        
+        OUTPUTS: Array of integrals
+        """
+        
+        shape = numpy.shape(z)
+        z = asarray(z, dtype=numpy.float64).ravel()
+        zMax = z.max() if z.size else 0.0
+        
+        zTable, chiTable, slopeTable = self.tableTo(min(zMax, self.tableLimit))
+        step = self.tableStep
+        
+        index = numpy.clip((z / step).astype(numpy.int64), 0, len(zTable) - 2)
+        t = z / step - index
+        
+        result = ((1.0 + 2.0 * t) * (1.0 - t)**2 * chiTable[index] +
+                  t * (1.0 - t)**2 * step * slopeTable[index] +
+                  t**2 * (3.0 - 2.0 * t) * chiTable[index + 1] +
+                  t**2 * (t - 1.0) * step * slopeTable[index + 1])
+        
+        negative = z < 0.0
+        
+        if negative.any():
+            result[negative] = [self.iRoutine.integrate(0.0, value) for value in z[negative]]
+        
+        # Beyond the end of the table (at tableLimit) only the rest of
+        # the integral is calculated, with the rule of the table
+        
+        beyond = z > zTable[-1]
+        
+        if beyond.any():
+            quadrature = self.tableQuadrature()
+            
+            result[beyond] = chiTable[-1] + quadrature.integrateMany(zTable[-1], z[beyond])
+        
+        return result.reshape(shape)
+
     def dm(self, z):
         """Calculates line-of-sight comoving distance
         
-        INPUTS: Redshift, z
+        INPUTS: Redshift, z, or an array of redshifts
         
         OUTPUTS: D_m(z) in units of h^{-1} Mpc
         
         v1.0 Robert J. Brunner, Jan. 18, 2007
         """
         
-        return ((3000.0 / self.h0) * self.iRoutine.integrate(0.0, float(z)))
+        if numpy.ndim(z) == 0:
+            return self.cachedDistance(float(z))
+        
+        return (3000.0 / self.h0) * self.comovingIntegral(z)
+
+    def cachedDistance(self, z):
+        """Calculates the line-of-sight comoving distance of a single
+        redshift through the distance cache
+        
+        INPUTS: Redshift, z
+        
+        OUTPUTS: D_m(z) in units of h^{-1} Mpc
+        """
+        
+        key = (self.om, self.ol, self.h0, z)
+        cache = cdistance.cache
+        
+        with cdistance.cacheLock:
+            if key in cache:
+                cache.move_to_end(key)
+                cdistance.cacheHits += 1
+                
+                return cache[key]
+            
+            cdistance.cacheMisses += 1
+        
+        distance = float((3000.0 / self.h0) * self.comovingIntegral(z))
+        
+        with cdistance.cacheLock:
+            cache[key] = distance
+            
+            while len(cache) > cdistance.cacheSize:
+                cache.popitem(last=False)
+        
+        return distance
     
+    def comovingRedshift(self, chi):
+        """The inverse of comovingIntegral: calculates the redshift at
+        which the integral of 1/E reaches each value of an array. The
+        comoving distance table is used the other way round, with
+        the same grid: on each step the redshift is the cubic Hermite
+        interpolation using the exact derivative dz/dchi = E(z), which
+        is monotone since E is positive and smooth on the scale of a
+        step, and which is as accurate as the forward interpolation.
+        
+        INPUTS: Array of integrals
+        
+        OUTPUTS: Array of redshifts
+        """
+        
+        shape = numpy.shape(chi)
+        chi = asarray(chi, dtype=numpy.float64).ravel()
+        chiMax = chi.max() if chi.size else 0.0
+        
+        if chi.size and chi.min() < 0.0:
+            raise ValueError("comoving distances must not be negative")
+        
+        # The integral converges as z goes to infinity (for om > 0), so
+        # the table can only be extended up to a point
+        
+        table = self.tableTo(0.0)
+        
+        while chiMax > table[1][-1]:
+            if table[0][-1] >= self.tableLimit:
+                raise ValueError("comoving distance beyond that of redshift %g" % table[0][-1])
+            
+            table = self.tableTo(2.0 * table[0][-1])
+        
+        zTable, chiTable, slopeTable = table
+        
+        index = numpy.clip(numpy.searchsorted(chiTable, chi, side='right') - 1, 0, len(zTable) - 2)
+        width = chiTable[index + 1] - chiTable[index]
+        t = (chi - chiTable[index]) / width
+        
+        result = ((1.0 + 2.0 * t) * (1.0 - t)**2 * zTable[index] +
+                  t * (1.0 - t)**2 * width / slopeTable[index] +
+                  t**2 * (3.0 - 2.0 * t) * zTable[index + 1] +
+                  t**2 * (t - 1.0) * width / slopeTable[index + 1])
+        
+        return result.reshape(shape)
+
+    def redshift(self, dm):
+        """Calculates the redshift of a line-of-sight comoving
+        distance, the inverse of dm
+        
+        INPUTS: Comoving distance in units of h^{-1} Mpc, or an array
+        of them
+        
+        OUTPUTS: Redshift, z
+        """
+        
+        z = self.comovingRedshift(asarray(dm, dtype=numpy.float64) * (self.h0 / 3000.0))
+        
+        if numpy.ndim(dm) == 0:
+            return float(z)
+        
+        return z
+
+    def randomRedshifts(self, count, zMin, zMax, random = None):
+        """Draws redshifts uniformly distributed in comoving volume
+        between two redshifts, as needed for the random catalogs of
+        three dimensional correlation functions: the comoving distance
+        is drawn with a density proportional to its square, and then
+        converted back into a redshift
+        
+        INPUTS: Number of redshifts, redshift range, optional NumPy
+        random generator (or RandomState)
+        
+        OUTPUTS: Array of redshifts
+        """
+        
+        if random is None:
+            random = numpy.random
+        
+        low, high = self.comovingIntegral(numpy.array([zMin, zMax], dtype=numpy.float64))**3
+        
+        chi = numpy.cbrt(low + (high - low) * random.random(count))
+        
+        return numpy.clip(self.comovingRedshift(chi), zMin, zMax)
+
     def da(self, z):
         """Calculates angular-diamter distance
         
-        INPUTS: Redshift, z
+        INPUTS: Redshift, z, or an array of redshifts
         
         OUTPUTS: D_a(z) in units of h^{-1} Mpc
         
         v1.0 Robert J. Brunner, Jan. 18, 2007
         """
         
-        return (self.dm(float(z)) / (1.0 + float(z)))
+        if numpy.ndim(z) == 0:
+            return (self.dm(float(z)) / (1.0 + float(z)))
+        
+        return (self.dm(z) / (1.0 + asarray(z)))
         
     def dl(self, z):
         """Calculates luminosity distance
         
-        INPUTS: Redshift, z
+        INPUTS: Redshift, z, or an array of redshifts
         
         OUTPUTS: D_l(z) in units of h^{-1} Mpc
         
         v1.0 Robert J. Brunner, Jan. 18, 2007
         """
         
-        return (self.dm(float(z)) * (1.0 + float(z)))
+        if numpy.ndim(z) == 0:
+            return (self.dm(float(z)) * (1.0 + float(z)))
+        
+        return (self.dm(z) * (1.0 + asarray(z)))
         
 # Test Code
 
@@ -88,3 +552,8 @@ if __name__ == '__main__':
     print("Angular Diameter distance at a redshift of 1.0 = ", c.da(1.0), "  h^{-1} Mpc")
 
     print("Luminosity distance at a redshift of .843 = ", c.dl(0.843), " h^{-1} Mpc", "RI gives 3748.841008")
+    print("Comoving distances at redshifts of 0.1, 0.5 and 1.0 = ", c.dm(numpy.array([0.1, 0.5, 1.0])),
+          " h^{-1} Mpc, to within ", c.tableError)
+    print("Distance cache ", cdistance.cacheInfo())
+    print("Redshift at a comoving distance of 2314.28 h^{-1} Mpc = ", c.redshift(2314.28119928))
+    print("Random redshifts between 0.1 and 0.3 = ", c.randomRedshifts(5, 0.1, 0.3))
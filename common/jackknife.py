@@ -4,6 +4,8 @@ from gzip import GzipFile
 
 from math import degrees, atan2, asin
 
+import numpy
+
 # Globally useful functions:
 
 def cumulate(data):
@@ -197,6 +199,128 @@ class jkTree:
     def getJackknife(self, pcsource):
         return self.root.getJackknife(pcsource)
 
+class jkFlatTree:
+
+    """The class that represents the Jackknife Tree as flat arrays
+
+    The tree is split exactly as by jkTree: each node is split at the
+    mean of the Cartesian coordinate with the largest standard
+    deviation, the sources below the mean going to the left. Instead
+    of node objects holding sorted lists of sources, it is built level
+    by level on an (n, 3) array of Cartesian coordinates. The node of
+    every source is kept in an integer array, so the statistics of all
+    the nodes of a level are computed at once with bincount, and the
+    sources are sent down to the next level with a comparison, with
+    no sorting at all.
+
+    The nodes are numbered level by level (node k has the children
+    2k + 1 and 2k + 2), and the tree is kept in the arrays
+    splitColumn, splitValue and children (-1 for the leaves), with the
+    jackknife number of each leaf in region. As for jkTree the leaves
+    are numbered from left to right.
+    """
+
+    def __init__(self, level, sources):
+
+        positions = numpy.asarray(sources, dtype=numpy.float64).reshape(-1, 3)
+
+        self.level = level
+
+        nodes = (1 << (level + 1)) - 1
+        inner = (1 << level) - 1
+
+        self.splitColumn = numpy.full(nodes, -1, dtype=numpy.int64)
+        self.splitValue = numpy.zeros(nodes, dtype=numpy.float64)
+        self.children = numpy.full((nodes, 2), -1, dtype=numpy.int64)
+
+        self.children[:inner, 0] = 2 * numpy.arange(inner) + 1
+        self.children[:inner, 1] = 2 * numpy.arange(inner) + 2
+
+        self.region = numpy.full(nodes, -1, dtype=numpy.int64)
+        self.region[inner:] = numpy.arange(1 << level)
+
+        node = numpy.zeros(len(positions), dtype=numpy.int64) # Node of each source within its level
+
+        for depth in range(level):
+            width = 1 << depth
+
+            (column, value) = self.split(positions, node, width)
+
+            self.splitColumn[width - 1:2 * width - 1] = column
+            self.splitValue[width - 1:2 * width - 1] = value
+
+            right = positions[numpy.arange(len(positions)), column[node]] >= value[node]
+
+            node = 2 * node + right
+
+    def split(self, positions, node, width):
+        """Computes the split column and value of all the nodes of a
+        level, with the same choice of column as jkNonLeafNode"""
+
+        counts = numpy.maximum(numpy.bincount(node, minlength=width), 1)
+
+        means = numpy.array([numpy.bincount(node, positions[:, column], width) / counts
+                             for column in range(3)])
+
+        sigmas = numpy.sqrt(numpy.array([numpy.bincount(node, (positions[:, column] -
+                                                                means[column][node])**2, width) / counts
+                                         for column in range(3)]))
+
+        (sigmaX, sigmaY, sigmaZ) = sigmas
+
+        column = numpy.where(sigmaX > sigmaY, numpy.where(sigmaX > sigmaZ, 0, 2),
+                             numpy.where(sigmaY > sigmaZ, 1, 2))
+
+        return (column, means[column, numpy.arange(width)])
+
+    def getJackknife(self, pcsource):
+
+        index = 0
+
+        while self.children[index, 0] >= 0:
+            if pcsource.getCartesianValue(self.splitColumn[index]) < self.splitValue[index]:
+                index = self.children[index, 0]
+            else:
+                index = self.children[index, 1]
+
+        return int(self.region[index])
+
+    def assign(self, points):
+        """Finds the jackknife numbers of a whole catalog at once, by
+        sending all the sources down the tree together, one level at
+        a time
+
+        INPUTS: A catalog (pccatalog or any of its subclasses), or an
+        (n, 3) array of Cartesian coordinates
+
+        OUTPUTS: Integer array of jackknife numbers
+        """
+
+        if hasattr(points, 'cartesian'):
+            points = points.cartesian()
+
+        positions = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        rows = numpy.arange(len(positions))
+
+        node = numpy.zeros(len(positions), dtype=numpy.int64)
+
+        for depth in range(self.level):
+            index = (1 << depth) - 1 + node
+
+            right = positions[rows, self.splitColumn[index]] >= self.splitValue[index]
+
+            node = 2 * node + right
+
+        return self.region[(1 << self.level) - 1 + node]
+
+    def setJackknife(self, sources):
+        """Sets the jk attribute of a list of pczsourcejk objects"""
+
+        positions = [[source.getCartesianValue(index) for index in range(3)] for source in sources]
+
+        for (source, jk) in zip(sources, self.assign(positions)):
+            source.jk = int(jk)
+
 def theMain(inFile, treeLevel, raCol, decCol):
 
     from common.pcsource import pcsource
@@ -211,13 +335,13 @@ def theMain(inFile, treeLevel, raCol, decCol):
                         source.getCartesianValue(2)))
 
     for source in cSources:
-	print(source[0], source[1], source[2])
+        print(source[0], source[1], source[2])
 
     jktree = jkTree(treeLevel, cSources)
 
 #   for source in sources:
 #     print source.ra, source.dec, jktree.getJackknife(source)
-	
+
 #   print jktree
 
 #   jackknifeNumbers = [jktree.getJackknife(source) for source in sources]
@@ -0,0 +1,688 @@
+# paircount.py
+#
+# This file contains the pair counting engine for three dimensional
+# correlation functions of pczsource catalogs. The sources are placed at
+# their comoving positions (the unit vectors scaled by the line-of-sight
+# comoving distances), and sorted into a cell list: a grid of cubic
+# cells as wide as the largest separation counted, with the points of
+# every cell contiguous in memory. A point then only needs to be
+# compared with the points of its own cell and of the 26 cells around
+# it, and pairs in cells further apart are never looked at.
+#
+# The pairs of neighbouring cells are compared in blocks of about
+# maxPairs pairs, with all the distances of a block calculated and
+# binned by NumPy at once, and the blocks can be spread over a pool of
+# processes. The counts are exact: every pair is compared in double
+# precision against the squared bin edges.
+#
+# Positions given in single precision, such as the unit vectors of a
+# compact pcvcatalog, stay in single precision in the cell lists, and
+# are only converted to double precision for the pairs of each block.
+# The counts are then exact for the stored positions, at half the
+# memory. Angular pair counts are obtained the same way, from the
+# chords between the unit vectors (see angularPairCounts).
+#
+# Pairs can be counted in bins of the three dimensional separation r,
+# or in two dimensional bins of the separations across (r_p) and along
+# (pi) the line of sight, for the projected correlation function
+# w_p(r_p). The line of sight of a pair is the direction of the
+# midpoint of its two points.
+#
+#   counts = comovingPairCounts(data, randoms, edges, processes = 4)
+#   print(counts["DD"], counts["DR"], counts["RR"])
+#
+#   counts = comovingPairCounts(data, randoms, rpEdges, piEdges = piEdges)
+#
+# The catalogs can also be given as iterators of catalogs, such as
+# pczsource.iterSources generates, so that a catalog read from a file
+# is only ever held in memory as its positions.
+#
+#   counts = comovingPairCounts(pczsource.iterSources("data.txt"), ...)
+#
+# For jackknife errors the pairs can also be counted per pair of
+# jackknife regions (the jk column of pczcatalogjk, see jkFlatTree), in
+# the same single pass. The counts leaving out each region, and from
+# them the jackknife covariance of any estimate, are then obtained by
+# subtraction (see leaveOneOut and jackknifeCovariance).
+#
+#   counts = comovingPairCounts(data, randoms, edges, jackknife = True)
+#   xi = landySzalay(counts["DD"], counts["DR"], counts["RR"], ...)
+#
+
+import itertools
+import multiprocessing
+import numpy
+from numpy import arange, asarray, bincount, cumsum, repeat, searchsorted, zeros
+
+from .pcqcatalog import pcvcatalog
+
+maxPairs = 1 << 20 # Number of pairs compared at once
+
+def positionArray(positions):
+    """
+
+    Returns the positions as an (n, 3) array, in single precision if
+    they are given in single precision, else in double precision.
+
+    """
+
+    positions = asarray(positions)
+
+    if positions.dtype != numpy.float32:
+        positions = positions.astype(numpy.float64, copy=False)
+
+    return positions.reshape(-1, 3)
+
+class cellList(object):
+    """
+
+    The class that represents a set of points sorted into the cubic
+    cells of a grid.
+
+    """
+
+    def __init__(self, positions, cellSize, lower, shape):
+        """
+
+        Sorts the points into the cells of the grid.
+
+        INPUTS: (n, 3) array of positions (single or double
+        precision), width of the cells, lower corner and number of
+        cells along each axis of the grid
+
+        """
+
+        positions = positionArray(positions)
+
+        self.cellSize = float(cellSize)
+        self.lower = asarray(lower, dtype=numpy.float64)
+        self.shape = asarray(shape, dtype=numpy.int64)
+
+        cells = numpy.floor((positions - self.lower) / self.cellSize).astype(numpy.int64)
+        cells = numpy.clip(cells, 0, self.shape - 1)
+
+        keys = self.linearize(cells)
+
+        # The points sorted by cell, so that each cell is a contiguous
+        # range; order gives the original index of each sorted point
+
+        self.order = numpy.argsort(keys, kind='mergesort')
+        self.positions = positions[self.order]
+
+        self.keys, self.starts, self.counts = numpy.unique(keys[self.order], return_index=True,
+                                                           return_counts=True)
+        self.cells = cells[self.order][self.starts]
+
+    def linearize(self, cells):
+        """
+
+        Returns the single integer key of each cell of an (n, 3)
+        array of cell coordinates.
+
+        """
+
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def grid(cls, positionsList, cellSize):
+        """
+
+        Creates the cell lists of several sets of points on one
+        common grid, which covers them all.
+
+        INPUTS: Sequence of (n, 3) arrays of positions, width of the
+        cells
+
+        OUTPUTS: List of cell lists
+
+        """
+
+        positionsList = [positionArray(positions) for positions in positionsList]
+
+        points = numpy.concatenate(positionsList)
+
+        if not len(points):
+            points = zeros((1, 3))
+
+        lower = points.min(axis=0)
+        shape = numpy.floor((points.max(axis=0) - lower) / cellSize).astype(numpy.int64) + 1
+
+        return [cls(positions, cellSize, lower, shape) for positions in positionsList]
+
+    grid = classmethod(grid)
+
+    def neighbours(self, other, auto = False):
+        """
+
+        Finds the pairs of occupied neighbouring cells of this cell
+        list and another one on the same grid. For an auto count (a
+        cell list with itself) only half of the neighbours are used,
+        so that every pair of cells is found once.
+
+        INPUTS: The other cell list, whether it is this one
+
+        OUTPUTS: Arrays of the cell indices in this list and in the
+        other one, and boolean array true for a cell with itself
+
+        """
+
+        mine = []
+        theirs = []
+        same = []
+
+        for offset in itertools.product((-1, 0, 1), repeat=3):
+            if auto and offset < (0, 0, 0):
+                continue
+
+            cells = self.cells + offset
+            inside = numpy.flatnonzero(((cells >= 0) & (cells < self.shape)).all(axis=1))
+
+            keys = self.linearize(cells[inside])
+            index = numpy.minimum(searchsorted(other.keys, keys), max(len(other.keys) - 1, 0))
+
+            found = (other.keys[index] == keys) if len(other.keys) else numpy.zeros(len(keys), bool)
+
+            mine.append(inside[found])
+            theirs.append(index[found])
+            same.append(numpy.full(found.sum(), auto and offset == (0, 0, 0)))
+
+        return (numpy.concatenate(mine), numpy.concatenate(theirs), numpy.concatenate(same))
+
+    def blocks(self, other, auto = False, size = None):
+        """
+
+        Splits the comparisons of the points of this cell list with
+        those of another one into blocks of about size pairs. Pairs of
+        cells with more pairs than that are split by rows.
+
+        INPUTS: The other cell list, whether it is this one, block
+        size in pairs
+
+        OUTPUTS: List of blocks, each a tuple of arrays of the first
+        point and number of points of the rows and columns of every
+        pair of cells, and whether it is a cell with itself
+
+        """
+
+        size = size or maxPairs
+
+        mine, theirs, same = self.neighbours(other, auto)
+
+        startsA, countsA = self.starts[mine], self.counts[mine]
+        startsB, countsB = other.starts[theirs], other.counts[theirs]
+
+        rows = numpy.maximum(1, size // countsB)
+        pieces = (countsA + rows - 1) // rows
+
+        cell = repeat(arange(len(pieces)), pieces)
+        piece = arange(pieces.sum()) - repeat(cumsum(pieces) - pieces, pieces)
+
+        startsA = startsA[cell] + piece * rows[cell]
+        countsA = numpy.minimum(rows[cell], countsA[cell] - piece * rows[cell])
+        startsB, countsB, same = startsB[cell], countsB[cell], same[cell]
+
+        sizes = countsA * countsB
+        groups = (cumsum(sizes) - sizes) // size
+        bounds = numpy.flatnonzero(numpy.diff(groups)) + 1
+
+        return [tuple([values[low:high] for values in (startsA, countsA, startsB, countsB, same)])
+                for low, high in zip(numpy.concatenate(([0], bounds)),
+                                     numpy.concatenate((bounds, [len(sizes)])))]
+
+# End of cellList class definition
+
+# The kernels take the positions of the two points of a block of pairs
+# and the bin edges, and return the flat bin index of every pair (-1
+# for pairs outside of all the bins). They are module level functions,
+# so that they can be sent to the processes of a pool.
+
+def radialKernel(positionsA, positionsB, edges):
+    """
+
+    Bins the pairs by their separation r, edges[k] <= r < edges[k + 1].
+
+    """
+
+    delta = positionsA - positionsB
+    distance2 = numpy.einsum('ij,ij->i', delta, delta)
+
+    bins = searchsorted(edges**2, distance2, side='right') - 1
+    bins[bins >= len(edges) - 1] = -1
+
+    return bins
+
+def projectedKernel(positionsA, positionsB, edges):
+    """
+
+    Bins the pairs by their separations across and along the line of
+    sight of their midpoint, edges being the tuple of the r_p and pi
+    edges. The bin of a pair is the flat index of the (r_p, pi) bin
+    in an (n_rp, n_pi) array, as for the counters of binSortCount.
+
+    """
+
+    rpEdges, piEdges = edges
+
+    delta = positionsA - positionsB
+    middle = positionsA + positionsB
+
+    distance2 = numpy.einsum('ij,ij->i', delta, delta)
+    middle2 = numpy.einsum('ij,ij->i', middle, middle)
+
+    along = numpy.abs(numpy.einsum('ij,ij->i', delta, middle)) / \
+            numpy.sqrt(numpy.where(middle2 > 0.0, middle2, 1.0))
+    across2 = numpy.maximum(distance2 - along**2, 0.0)
+
+    rp = searchsorted(rpEdges**2, across2, side='right') - 1
+    pi = searchsorted(piEdges, along, side='right') - 1
+
+    inside = (rp >= 0) & (rp < len(rpEdges) - 1) & (pi >= 0) & (pi < len(piEdges) - 1)
+
+    return numpy.where(inside, rp * (len(piEdges) - 1) + pi, -1)
+
+def countBlock(data, kernel, edges, size, block):
+    """
+
+    Counts the pairs of one block in their bins.
+
+    INPUTS: Tuple of the sorted positions of the two cell lists, of
+    their sorted regions (or None) and of the number of regions,
+    kernel, bin edges, total number of bins, block (see
+    cellList.blocks)
+
+    OUTPUTS: Array of counts, one per bin, or one per bin for every
+    pair of regions
+
+    """
+
+    positionsA, positionsB, regionsA, regionsB, regions = data
+    startsA, countsA, startsB, countsB, same = block
+
+    sizes = countsA * countsB
+
+    pair = repeat(arange(len(sizes)), sizes)
+    local = arange(sizes.sum()) - repeat(cumsum(sizes) - sizes, sizes)
+
+    i = startsA[pair] + local // countsB[pair]
+    j = startsB[pair] + local % countsB[pair]
+
+    # Within a cell compared with itself each pair is only counted once
+
+    keep = ~same[pair] | (i < j)
+    i, j = i[keep], j[keep]
+
+    # Single precision positions are decoded here, for this block only
+
+    bins = kernel(positionsA[i].astype(numpy.float64, copy=False),
+                  positionsB[j].astype(numpy.float64, copy=False), edges)
+    inside = bins >= 0
+
+    if regionsA is None:
+        return bincount(bins[inside], minlength=size)
+
+    index = (regionsA[i[inside]] * regions + regionsB[j[inside]]) * size + bins[inside]
+
+    return bincount(index, minlength=regions * regions * size)
+
+# The data of the cell lists is sent once to each process of a pool, and
+# then only the blocks are sent.
+
+workerData = None
+
+def countBlockInit(data):
+    global workerData
+    workerData = data
+
+def countBlockWorker(task):
+    return countBlock(workerData, *task)
+
+def countPairs(lists, kernel, edges, shape, processes = 1, auto = False, regions = None,
+               count = None):
+    """
+
+    Counts the pairs of two cell lists on the same grid.
+
+    INPUTS: Tuple of the two cell lists, kernel, bin edges, shape of
+    the counts, number of processes (None for all the processors),
+    whether the two cell lists are the same (counting each pair once),
+    optional tuple of the integer region of every point of the two
+    cell lists (in their original order) and number of regions
+
+    OUTPUTS: Array of counts of the given shape, or with regions of
+    shape (count, count) + shape, counts[i, j] holding the pairs of a
+    point of region i with a point of region j. For auto counts each
+    pair is only counted once, in either counts[i, j] or counts[j, i].
+
+    """
+
+    bins = int(numpy.prod(shape))
+    size = bins
+
+    if regions is None:
+        data = (lists[0].positions, lists[1].positions, None, None, 0)
+    else:
+        regions = [asarray(values, dtype=numpy.int64) for values in regions]
+
+        if count is None:
+            count = max([int(values.max()) + 1 for values in regions if len(values)] or [1])
+
+        data = (lists[0].positions, lists[1].positions,
+                regions[0][lists[0].order], regions[-1][lists[1].order], count)
+
+        shape = (count, count) + tuple(shape)
+        size *= count * count
+
+    tasks = [(kernel, edges, bins, block) for block in lists[0].blocks(lists[1], auto)]
+    counts = zeros(size, dtype=numpy.int64)
+
+    if processes == 1:
+        for task in tasks:
+            counts += countBlock(data, *task)
+
+    elif tasks:
+        pool = multiprocessing.Pool(processes, countBlockInit, (data,))
+
+        try:
+            for result in pool.imap_unordered(countBlockWorker, tasks):
+                counts += result
+
+        finally:
+            pool.terminate()
+
+    return counts.reshape(shape)
+
+def positionsOf(points):
+    """
+
+    Returns the comoving positions of a catalog (see
+    pczcatalog.comovingCartesian), or the points themselves if they
+    are already an (n, 3) array (single precision arrays are kept as
+    they are). For an iterator of catalogs, the positions of every
+    catalog it generates are concatenated, one catalog at a time.
+
+    """
+
+    if hasattr(points, '__next__'):
+        return numpy.concatenate([positionsOf(batch) for batch in points] or [zeros((0, 3))])
+
+    if hasattr(points, 'comovingCartesian'):
+        return points.comovingCartesian()
+
+    return positionArray(points)
+
+def columnsOf(points, jackknife = False):
+    """
+
+    Returns the positions of a catalog, or of an iterator of catalogs
+    (see positionsOf), and with jackknife the array of its jackknife
+    regions (the jk column), reading the catalogs of an iterator only
+    once.
+
+    """
+
+    if not hasattr(points, '__next__'):
+        return (positionsOf(points),
+                asarray(points.jk, dtype=numpy.int64) if jackknife else None)
+
+    positions = []
+    jks = []
+
+    for batch in points:
+        positions.append(positionsOf(batch))
+
+        if jackknife:
+            jks.append(asarray(batch.jk, dtype=numpy.int64))
+
+    return (numpy.concatenate(positions or [zeros((0, 3))]),
+            numpy.concatenate(jks or [zeros(0, dtype=numpy.int64)]) if jackknife else None)
+
+def unitVectorsOf(points):
+    """
+
+    Returns the unit vectors of a catalog of any class, those of a
+    pcvcatalog in the single precision they are stored in, or the
+    points themselves if they are already an (n, 3) array. As for
+    positionsOf, the catalogs can be generated by an iterator.
+
+    """
+
+    if hasattr(points, '__next__'):
+        return numpy.concatenate([unitVectorsOf(batch) for batch in points] or [zeros((0, 3))])
+
+    if isinstance(points, pcvcatalog):
+        return numpy.column_stack((points.x, points.y, points.z))
+
+    if hasattr(points, 'cartesian'):
+        return points.cartesian()
+
+    return positionArray(points)
+
+def pairCounts(points, others = None, edges = None, processes = 1, regions = None, count = None):
+    """
+
+    Counts the pairs of points in bins of three dimensional
+    separation.
+
+    INPUTS: Catalog (pczcatalog, or an iterator of them) or (n, 3)
+    array of positions, second catalog or array for cross pairs (None to count the pairs of the
+    first one with itself, each pair once), increasing bin edges in
+    h^{-1} Mpc, number of processes (None for all the processors),
+    optional tuple of the jackknife region arrays of the catalogs
+    and number of regions, to count per pair of regions
+
+    OUTPUTS: Array of len(edges) - 1 counts, with regions an array of
+    (count, count, len(edges) - 1) counts (see countPairs)
+
+    """
+
+    edges = asarray(edges, dtype=numpy.float64)
+
+    if others is None:
+        lists = cellList.grid([positionsOf(points)], edges[-1]) * 2
+    else:
+        lists = cellList.grid([positionsOf(points), positionsOf(others)], edges[-1])
+
+    return countPairs(lists, radialKernel, edges, (len(edges) - 1,), processes, others is None,
+                      regions, count)
+
+def angularPairCounts(points, others = None, edges = None, processes = 1, regions = None,
+                      count = None):
+    """
+
+    Counts the pairs of points in bins of angular separation. The
+    pairs are binned by the chord between their unit vectors, against
+    the chords 2 sin(theta / 2) of the bin edges, which is the same
+    as binning the angles but needs no trigonometry per pair.
+
+    INPUTS: As for pairCounts, with catalogs of any class (pccatalog,
+    or the compact pcqcatalog and pcvcatalog) or (n, 3) arrays of unit
+    vectors, and the increasing bin edges in degrees (at most 180)
+
+    OUTPUTS: As for pairCounts
+
+    """
+
+    chords = 2.0 * numpy.sin(0.5 * numpy.radians(asarray(edges, dtype=numpy.float64)))
+
+    return pairCounts(unitVectorsOf(points), None if others is None else unitVectorsOf(others),
+                      chords, processes, regions, count)
+
+def projectedPairCounts(points, others = None, rpEdges = None, piEdges = None, processes = 1,
+                        regions = None, count = None):
+    """
+
+    Counts the pairs of points in bins of projected separation r_p
+    and line-of-sight separation pi. Only the pairs closer than
+    sqrt(rp_max^2 + pi_max^2) in three dimensions are compared.
+
+    INPUTS: As for pairCounts, with the increasing bin edges of r_p
+    and of pi (the absolute line-of-sight separation) in h^{-1} Mpc
+
+    OUTPUTS: (len(rpEdges) - 1, len(piEdges) - 1) array of counts,
+    with regions (count, count, len(rpEdges) - 1, len(piEdges) - 1)
+
+    """
+
+    edges = (asarray(rpEdges, dtype=numpy.float64), asarray(piEdges, dtype=numpy.float64))
+    shape = (len(edges[0]) - 1, len(edges[1]) - 1)
+
+    cellSize = numpy.hypot(edges[0][-1], edges[1][-1])
+
+    if others is None:
+        lists = cellList.grid([positionsOf(points)], cellSize) * 2
+    else:
+        lists = cellList.grid([positionsOf(points), positionsOf(others)], cellSize)
+
+    return countPairs(lists, projectedKernel, edges, shape, processes, others is None,
+                      regions, count)
+
+def comovingPairCounts(data, randoms = None, edges = None, processes = 1, piEdges = None,
+                       jackknife = False):
+    """
+
+    Counts the data-data pairs of a catalog and, given a random
+    catalog, the data-random and random-random pairs, as needed by
+    the estimators of the correlation function.
+
+    INPUTS: Data and random catalogs (arrays of positions, or
+    iterators of catalogs), bin edges in h^{-1} Mpc, number of
+    processes, and the bin edges of
+    pi to count in (r_p, pi) bins instead (edges then being those of
+    r_p, see projectedPairCounts), and whether to count per pair of
+    jackknife regions, from the jk columns of the catalogs
+    (pczcatalogjk)
+
+    OUTPUTS: Dictionary of DD and, with randoms, DR and RR counts;
+    with jackknife, the counts are per pair of regions and the number
+    of data and random points of each region are added as ND and NR
+
+    """
+
+    counter = pairCounts if piEdges is None else \
+        (lambda points, others, edges, *options: projectedPairCounts(points, others, edges, piEdges, *options))
+
+    catalogs = [catalog for catalog in (data, randoms) if catalog is not None]
+
+    positions, jks = zip(*[columnsOf(catalog, jackknife) for catalog in catalogs])
+
+    if jackknife:
+        number = max([int(jk.max()) + 1 for jk in jks if len(jk)] or [1])
+
+    def count(first, second):
+        regions = (jks[first], jks[second]) if jackknife else None
+        others = None if first == second else positions[second]
+
+        return counter(positions[first], others, edges, processes, regions, number if jackknife else None)
+
+    counts = {"DD": count(0, 0)}
+
+    if randoms is not None:
+        counts["DR"] = count(0, 1)
+        counts["RR"] = count(1, 1)
+
+    if jackknife:
+        counts["ND"] = bincount(jks[0], minlength=number)
+
+        if randoms is not None:
+            counts["NR"] = bincount(jks[1], minlength=number)
+
+    return counts
+
+def leaveOneOut(counts):
+    """
+
+    Derives the pair counts leaving out each jackknife region in turn
+    from the counts per pair of regions: all the pairs, less those
+    with a point in the region.
+
+    INPUTS: (N, N, ...) array of counts per pair of regions
+
+    OUTPUTS: (N, ...) array, the counts without each of the N regions
+
+    """
+
+    regions = arange(counts.shape[0])
+
+    return (counts.sum(axis=(0, 1)) - counts.sum(axis=1) - counts.sum(axis=0) +
+            counts[regions, regions])
+
+def landySzalay(dd, dr, rr, nd, nr):
+    """
+
+    The Landy-Szalay estimator of the correlation function, from the
+    DD, DR and RR counts (of auto counts, each pair counted once) of
+    nd data and nr random points. All the arguments may be arrays of
+    the same leading shape, such as the leave-one-out counts.
+
+    """
+
+    nd = asarray(nd, dtype=numpy.float64)
+    nr = asarray(nr, dtype=numpy.float64)
+
+    extra = (Ellipsis,) + (numpy.newaxis,) * (numpy.ndim(dd) - numpy.ndim(nd))
+
+    dd = dd / (0.5 * nd * (nd - 1.0))[extra]
+    dr = dr / (nd * nr)[extra]
+    rr = rr / (0.5 * nr * (nr - 1.0))[extra]
+
+    return (dd - 2.0 * dr + rr) / rr
+
+def jackknifeEstimates(counts):
+    """
+
+    Calculates the Landy-Szalay correlation function of the whole
+    sample and of each leave-one-out sample, from the output of
+    comovingPairCounts with jackknife = True.
+
+    OUTPUTS: The full estimate and the (N, ...) array of leave-one-out
+    estimates
+
+    """
+
+    dd, dr, rr = counts["DD"], counts["DR"], counts["RR"]
+    nd, nr = counts["ND"], counts["NR"]
+
+    full = landySzalay(dd.sum(axis=(0, 1)), dr.sum(axis=(0, 1)), rr.sum(axis=(0, 1)),
+                       nd.sum(), nr.sum())
+
+    return (full, landySzalay(leaveOneOut(dd), leaveOneOut(dr), leaveOneOut(rr),
+                              nd.sum() - nd, nr.sum() - nr))
+
+def jackknifeCovariance(estimates):
+    """
+
+    The jackknife covariance matrix of the leave-one-out estimates,
+    (N - 1) / N times the sum of the products of their deviations from
+    their mean.
+
+    INPUTS: (N, ...) array of leave-one-out estimates
+
+    OUTPUTS: Covariance matrix of the flattened bins
+
+    """
+
+    estimates = asarray(estimates, dtype=numpy.float64)
+    estimates = estimates.reshape(len(estimates), -1)
+
+    deviations = estimates - estimates.mean(axis=0)
+
+    return (len(estimates) - 1.0) / len(estimates) * numpy.dot(deviations.T, deviations)
+
+# Test Code
+
+if __name__ == '__main__':
+
+    from .pczcatalog import pczcatalog
+
+    random = numpy.random.RandomState(42)
+
+    catalog = pczcatalog.create(random.uniform(0, 10, 2000), random.uniform(0, 10, 2000),
+                                random.uniform(0.1, 0.2, 2000))
+
+    edges = numpy.linspace(1.0, 20.0, 6)
+
+    print(comovingPairCounts(catalog[:1000], catalog[1000:], edges))
+    print(projectedPairCounts(catalog, None, edges, numpy.linspace(0.0, 40.0, 5)))
+
+    jk = random.randint(0, 4, 2000)
+
+    print(leaveOneOut(pairCounts(catalog, None, edges, regions = (jk,))))
@@ -0,0 +1,756 @@
+# pccatalog.py
+#
+# This file contains the pccatalog class, which holds a whole catalog of
+# ra/dec pairs, along with the precomputed quantities, as contiguous
+# NumPy columns (a struct of arrays) instead of a list of pcsource
+# objects (an array of structs). Each column costs eight bytes per
+# source, compared to well over a hundred bytes for a pcsource object
+# holding six Python floats, and the columns can be handed directly to
+# vectorized kernels.
+#
+# A catalog can be indexed like a list: an integer gives back a
+# pcsource object, built only when asked for, while a slice gives a
+# new catalog whose columns are views on the original ones (no
+# copy). Subclasses for the other source classes only need to override
+# the columns, sourceClass and the create method.
+#
+
+import io
+import os
+import numpy
+from functools import partial
+from gzip import GzipFile
+from numpy import radians, sin, cos, asarray, concatenate, empty
+from numpy import arcsin, sqrt, minimum, degrees, newaxis, column_stack
+
+from .pcsource import pcsource
+from .catalogio import readColumns, iterColumns, mapColumns, rebatch
+from .catalogio import isBinary, writeBinary, readBinary, checkHeader
+
+class pccatalog(object):
+    """
+
+    This class represents the angular coordinates of a catalog of
+    sources, along with the precomputed sine/cosine of the two angular
+    coordinates, as one NumPy array per quantity.
+
+    The columns are named, and ordered, like the arguments of the
+    constructor of sourceClass, so that source objects can be built
+    from a row of the catalog.
+
+    """
+
+    columns = ('ra', 'dec', 'sra', 'cra', 'sdec', 'cdec')
+    sourceClass = pcsource
+
+    # For a catalog sorted by the reorder method, the index in the
+    # original catalog of each source, else None.
+
+    permutation = None
+
+    # The text format of a row, as written by sourceClass.__repr__
+
+    textFormat = "%13.10f % 13.10f %14.12f %14.12f %14.12f %14.12f"
+
+    def __init__(self, ra, dec, sra, cra, sdec, cdec):
+
+        self.setColumns((ra, dec, sra, cra, sdec, cdec))
+
+    def setColumns(self, values):
+        """
+
+        Stores the given arrays as the columns of this catalog, in the
+        order of the columns attribute. Arrays that already have the
+        right type are stored as is, without a copy, which allows
+        views and memory maps to be wrapped in a catalog.
+
+        INPUTS: A sequence of arrays, one per column
+
+        OUTPUTS: None
+
+        """
+
+        for name, value in zip(self.columns, values):
+            setattr(self, name, asarray(value, dtype=self.columnType(name)))
+
+    def columnType(name):
+        """
+
+        Returns the NumPy type used to hold the named column. All the
+        coordinates and precomputed quantities are double precision.
+
+        """
+
+        return numpy.float64
+
+    def create(cls, ra, dec):
+        """
+
+        This class method converts arrays of ra/dec pairs into a
+        catalog, by computing the precomputed quantities for all the
+        sources at once.
+
+        INPUTS: Arrays (or sequences) of ra and dec in degrees
+
+        OUTPUTS: A new catalog
+
+        """
+
+        ra = asarray(ra, dtype=numpy.float64)
+        dec = asarray(dec, dtype=numpy.float64)
+
+        rra = radians(ra)
+        rdec = radians(dec)
+
+        return(cls(ra, dec, sin(rra), cos(rra), sin(rdec), cos(rdec)))
+
+    def fromColumns(cls, data):
+        """
+
+        Creates a catalog from a mapping of column name to array, such
+        as a dictionary or a NumPy record array.
+
+        """
+
+        return(cls(*[data[name] for name in cls.columns]))
+
+    def fromSources(cls, sources):
+        """
+
+        Creates a catalog from a list of source objects, such as the
+        one returned by the createSources or readSources methods of
+        sourceClass.
+
+        INPUTS: A list of source objects
+
+        OUTPUTS: A new catalog
+
+        """
+
+        values = []
+
+        for name in cls.columns:
+            column = empty(len(sources), dtype=cls.columnType(name))
+
+            for index, source in enumerate(sources):
+                column[index] = getattr(source, name)
+
+            values.append(column)
+
+        return(cls(*values))
+
+    def concatenate(cls, catalogs):
+        """
+
+        Joins a sequence of catalogs into a single new catalog.
+
+        """
+
+        if not catalogs:
+            return(cls(*[empty(0, dtype=cls.columnType(name)) for name in cls.columns]))
+
+        return(cls(*[concatenate([getattr(catalog, name) for catalog in catalogs])
+                     for name in cls.columns]))
+
+    def createCatalog(cls, infile, raColumn = 0, decColumn = 1, filterFunction = None,
+                      processes = 1, reorder = None):
+        """
+
+        Creates a new catalog from a file containing right ascension,
+        declination pairs. The file is parsed in large blocks, and the
+        precomputed quantities are calculated for whole columns.
+
+        INPUTS: Filename (plain or .gz) or file object, ra/dec column
+        ordinal numbers, filter function (as for
+        pcsource.createSources), number of processes used to parse the
+        file and calculate the precomputed quantities (None for all
+        the processors; a file object or .gz file is still read by
+        this process), and an optional spatial order for the sources
+        (see the reorder method)
+
+        OUTPUTS: A new catalog
+
+        """
+
+        return cls.createFromColumns(infile, (raColumn, decColumn), filterFunction, processes,
+                                     reorder)
+
+    def createFromColumns(cls, infile, columns, filterFunction = None, processes = 1,
+                          reorder = None):
+        """
+
+        Creates a new catalog from the given columns of a text file,
+        which are passed to the create method in order, and optionally
+        reorders it (see the reorder method).
+
+        INPUTS: Filename (plain or .gz) or file object, sequence of
+        column ordinal numbers, filter function, number of processes
+        (as for createCatalog)
+
+        OUTPUTS: A new catalog
+
+        """
+
+        if processes == 1:
+            catalog = cls.create(*readColumns(infile, columns, filterFunction))
+
+        else:
+            catalog = cls.concatenate(list(mapColumns(infile, columns, partial(precomputeChunk, cls, False),
+                                                      processes, filterFunction)))
+
+        if reorder:
+            catalog = catalog.reorder(reorder)
+
+        return catalog
+
+    def precompute(cls, infile, outfile, columns, filterFunction = None, processes = None,
+                   shards = False):
+        """
+
+        Creates new files containing the precomputed data for the
+        sources of a text file, using a pool of processes. The input
+        is split into blocks of lines, each one parsed and computed
+        by one process, and the results are written in the order of
+        the input.
+
+        The output is a binary catalog file if the filename ends with
+        .pcbin, else a gzip'd text file in the format of
+        sourceClass.writeSources (.gz is added to the name if
+        needed). In the text case the processes also format and
+        compress their blocks; since a series of gzip members is a
+        valid gzip file, they are simply appended to the output.
+
+        INPUTS: Input filename (plain or .gz) or file object, output
+        filename, sequence of the column ordinal numbers passed to
+        create, filter function (picklable), number of processes (None
+        for all the processors), and whether to write one output file
+        per block (named name.0000.ext, name.0001.ext, ...) instead of
+        a single file
+
+        OUTPUTS: List of the files written
+
+        """
+
+        binary = isBinary(outfile)
+
+        if not binary and not outfile.endswith(".gz"):
+            outfile += ".gz"
+
+        results = mapColumns(infile, columns, partial(precomputeChunk, cls, not binary),
+                             processes, filterFunction)
+
+        if shards:
+            base, extension = os.path.splitext(outfile)
+            outfiles = []
+
+            for index, result in enumerate(results):
+                outfiles.append("%s.%04d%s" % (base, index, extension))
+                writeChunk(outfiles[-1], result)
+
+            return outfiles
+
+        if binary:
+            cls.concatenate(list(results)).write(outfile)
+
+        else:
+            with open(outfile, 'wb') as output:
+                for result in results:
+                    output.write(result)
+
+        return [outfile]
+
+    def read(cls, infile, mmap = True, reorder = None):
+        """
+
+        Reads a catalog from a binary catalog file (see catalogio). By
+        default the columns are memory mapped, so that the catalog is
+        available at once, whatever its size. Reordering the catalog
+        (see the reorder method) reads it all into memory.
+
+        INPUTS: Filename, whether to memory map the columns, optional
+        spatial order for the sources
+
+        OUTPUTS: A new catalog
+
+        """
+
+        header, columns = readBinary(infile, mmap)
+
+        checkHeader(header, cls.columns, getattr(cls.sourceClass, 'cd', None))
+
+        catalog = cls.fromColumns(columns)
+
+        if reorder:
+            catalog = catalog.reorder(reorder)
+
+        return catalog
+
+    def iterCatalog(cls, infile, raColumn = 0, decColumn = 1, filterFunction = None,
+                    batchSize = 1 << 16):
+        """
+
+        The streaming version of createCatalog, which generates the
+        catalog in batches of batchSize sources. Only one batch is
+        held in memory at a time, so files larger than memory can be
+        processed, for example by counting pairs or assigning
+        jackknife regions one batch at a time.
+
+        INPUTS: As for createCatalog, number of sources per batch
+
+        OUTPUTS: Generates catalogs of batchSize sources (the last one
+        may be shorter)
+
+        """
+
+        return cls.iterFromColumns(infile, (raColumn, decColumn), filterFunction, batchSize)
+
+    def iterFromColumns(cls, infile, columns, filterFunction = None, batchSize = 1 << 16):
+        """
+
+        Generates catalogs of batchSize sources from the given columns
+        of a text file, which are passed to the create method in order.
+
+        """
+
+        # Text lines are read in blocks of about the size of a batch
+
+        for batch in rebatch(iterColumns(infile, columns, filterFunction, 128 * batchSize),
+                             batchSize):
+            yield cls.create(*batch)
+
+    def iterRead(cls, infile, batchSize = 1 << 16):
+        """
+
+        The streaming version of read, which also accepts the gzip'd
+        text files written by sourceClass.writeSources. Batches of a
+        binary catalog file are views on its memory map, and the pages
+        already used can be dropped by the operating system.
+
+        INPUTS: Filename (.pcbin, or text with or without the .gz
+        extension), number of sources per batch
+
+        OUTPUTS: Generates catalogs of batchSize sources (the last one
+        may be shorter)
+
+        """
+
+        if isBinary(infile):
+            catalog = cls.read(infile)
+
+            for start in range(0, len(catalog), batchSize):
+                yield catalog[start:start + batchSize]
+
+            return
+
+        if not infile.endswith(".gz"):
+            infile += ".gz"
+
+        for batch in rebatch(iterColumns(infile, range(len(cls.columns)), None, 128 * batchSize),
+                             batchSize):
+            yield cls(*batch)
+
+    # This is the magic statement to make the methods true "static
+    # methods" and "class methods"
+
+    columnType = staticmethod(columnType)
+    create = classmethod(create)
+    fromColumns = classmethod(fromColumns)
+    fromSources = classmethod(fromSources)
+    concatenate = classmethod(concatenate)
+    createCatalog = classmethod(createCatalog)
+    createFromColumns = classmethod(createFromColumns)
+    precompute = classmethod(precompute)
+    read = classmethod(read)
+    iterCatalog = classmethod(iterCatalog)
+    iterFromColumns = classmethod(iterFromColumns)
+    iterRead = classmethod(iterRead)
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __getitem__(self, key):
+        """
+
+        Indexing with an integer returns a new source object for that
+        row. Any other index (slice, integer array or boolean mask) is
+        applied to every column and returns a new catalog; a slice
+        gives views on the columns of this catalog, so no data is
+        copied.
+
+        """
+
+        if isinstance(key, (int, numpy.integer)):
+            return self.source(key)
+
+        return(self.__class__(*[getattr(self, name)[key] for name in self.columns]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.source(index)
+
+    def __repr__(self):
+        return("%s of %d sources" % (self.__class__.__name__, len(self)))
+
+    def source(self, index):
+        """
+
+        Builds the source object of sourceClass for the given row.
+
+        INPUTS: Row index
+
+        OUTPUTS: A source object
+
+        """
+
+        return(self.sourceClass(*[getattr(self, name)[index] for name in self.columns]))
+
+    def toSources(self):
+        """
+
+        Converts the catalog back into a list of source objects.
+
+        """
+
+        return list(self)
+
+    def attributes(self):
+        """
+
+        Returns the attributes stored in the header of a binary
+        catalog file along with the columns: the name of the source
+        class and, for sources with comoving distances, the
+        cosmological parameters used to calculate them.
+
+        """
+
+        attributes = {"class": self.sourceClass.__name__}
+
+        if hasattr(self.sourceClass, 'cd'):
+            attributes["cosmology"] = self.sourceClass.cd.parameters()
+
+        return attributes
+
+    def write(self, outfile):
+        """
+
+        Writes the catalog to a binary catalog file, which keeps the
+        full precision of the columns and can be memory mapped by the
+        read method.
+
+        INPUTS: Filename
+
+        OUTPUTS: None
+
+        """
+
+        writeBinary(outfile, self.columns, [getattr(self, name) for name in self.columns],
+                    self.attributes())
+
+    def reorder(self, method = 'morton', bits = 16):
+        """
+
+        Sorts the catalog along a space filling curve on the sky, so
+        that sources close on the sky are also close in memory. Blocks
+        of consecutive sources then cover compact areas, which helps
+        both the pruning and the cache use of block and tree based
+        pair counting.
+
+        The only method is 'morton', the Z-order curve of a
+        2^bits x 2^bits equal area grid in ra and sin(dec) (see
+        mortonIndex). The permutation attribute of the new catalog
+        gives, for each of its sources, the index of that source in
+        this catalog (so new.ra equals self.ra[new.permutation]); the
+        original order is restored with argsort(new.permutation).
+
+        INPUTS: Ordering method, bits per coordinate
+
+        OUTPUTS: A new, reordered, catalog
+
+        """
+
+        if method != 'morton':
+            raise ValueError("unknown catalog ordering %r" % (method,))
+
+        order = numpy.argsort(mortonIndex(self.ra, self.sdec, bits), kind='mergesort')
+
+        catalog = self[order]
+
+        if self.permutation is not None:
+            order = self.permutation[order]
+
+        catalog.permutation = order
+
+        return catalog
+
+    def toText(self):
+        """
+
+        Formats the catalog as text, one source per line in the format
+        of the sourceClass.__repr__ method (as written by
+        writeSources).
+
+        """
+
+        output = io.StringIO()
+
+        numpy.savetxt(output, numpy.column_stack([getattr(self, name) for name in self.columns]),
+                      fmt=self.textFormat)
+
+        return output.getvalue()
+
+    def nbytes(self):
+        """
+
+        Returns the memory used by the columns in bytes.
+
+        """
+
+        return sum([getattr(self, name).nbytes for name in self.columns])
+
+    def getCartesianValue(self, index):
+        """
+
+        Vectorized version of pcsource.getCartesianValue, which
+        returns the requested Cartesian coordinate of every source.
+        Note that the X, Y, Z coordinates are refernced as 0, 1, 2,
+        respectively.
+
+        INPUTS: Coordinate index to return
+
+        OUTPUTS: Array of the requested coordinate values.
+
+        """
+
+        if index == 0: # X coordinate value
+            return self.cdec * self.cra
+
+        elif index == 1: # Y coordinate value
+            return self.cdec * self.sra
+
+        elif index == 2: # Z coordinate value
+            return self.sdec
+
+        raise IndexError("Cartesian coordinate index must be 0, 1 or 2")
+
+    def cartesian(self):
+        """
+
+        Returns the unit vectors of all the sources as an (n, 3) array
+        of X, Y, Z coordinates.
+
+        """
+
+        return column_stack((self.getCartesianValue(0), self.getCartesianValue(1),
+                             self.getCartesianValue(2)))
+
+    # The batch distance methods below take as target either a single
+    # source object (one to many), giving an array with one value per
+    # source of this catalog, or another catalog (many to many), giving
+    # a (len(self), len(target)) array. Note that the many to many
+    # versions hold the whole matrix in memory.
+
+    def pairValues(self, target, names):
+        """
+
+        Returns the named columns of this catalog and the
+        corresponding values of the target, shaped so that they
+        broadcast into the result of a batch distance method.
+
+        """
+
+        if isinstance(target, pccatalog):
+            return ([getattr(self, name)[:, newaxis] for name in names],
+                    [getattr(target, name)[newaxis, :] for name in names])
+
+        return ([getattr(self, name) for name in names],
+                [float(getattr(target, name)) for name in names])
+
+    def pcCosTheta(self, target):
+        """
+
+        Batch version of pcsource.pcCosTheta, which calculates the
+        cosine of the angle between the sources and the target from
+        the precomputed columns only. As for the single source
+        version, this is not accurate for small separations.
+
+        INPUTS: A source object, or a catalog
+
+        OUTPUTS: Array of cosines
+
+        """
+
+        (sra, cra, sdec, cdec), (tsra, tcra, tsdec, tcdec) = \
+            self.pairValues(target, ('sra', 'cra', 'sdec', 'cdec'))
+
+        return cdec * tcdec * (cra * tcra + sra * tsra) + sdec * tsdec
+
+    def pcChordDistance2(self, target):
+        """
+
+        Calculates the square of the chord length between the unit
+        vectors of the sources and the target, from the precomputed
+        columns. Unlike the cosine, the chord is obtained from
+        differences of coordinates, so it keeps its relative accuracy
+        at small separations. The squared chord is 2 - 2 cos(theta),
+        and is the quantity to compare against squared bin edges.
+
+        INPUTS: A source object, or a catalog
+
+        OUTPUTS: Array of squared chord lengths
+
+        """
+
+        (sra, cra, sdec, cdec), (tsra, tcra, tsdec, tcdec) = \
+            self.pairValues(target, ('sra', 'cra', 'sdec', 'cdec'))
+
+        return ((cdec * cra - tcdec * tcra)**2 + (cdec * sra - tcdec * tsra)**2 +
+                (sdec - tsdec)**2)
+
+    def pcChordDistance(self, target):
+        """
+
+        Calculates the chord length between the unit vectors of the
+        sources and the target, see pcChordDistance2.
+
+        """
+
+        return sqrt(self.pcChordDistance2(target))
+
+    def pcAngularDistance(self, target):
+        """
+
+        Batch version of pcsource.pcAngularDistance, which calculates
+        the angle in radians between the sources and the target from
+        the precomputed columns. The angle is obtained from the chord
+        length, theta = 2 asin(chord / 2), instead of the arccosine,
+        so it is accurate at small separations as well.
+
+        INPUTS: A source object, or a catalog
+
+        OUTPUTS: Array of angles in radians
+
+        """
+
+        return 2.0 * arcsin(minimum(1.0, 0.5 * self.pcChordDistance(target)))
+
+    def pcAngularDistanceDegrees(self, target):
+        """
+
+        Same as pcAngularDistance, with the angles in degrees.
+
+        """
+
+        return degrees(self.pcAngularDistance(target))
+
+    def hsAngularDistance(self, target):
+        """
+
+        Batch version of pcsource.hsAngularDistance, which calculates
+        the angle in radians between the sources and the target with
+        the haversine formula on the ra/dec columns.
+
+        INPUTS: A source object, or a catalog
+
+        OUTPUTS: Array of angles in radians
+
+        """
+
+        (ra, dec), (tra, tdec) = self.pairValues(target, ('ra', 'dec'))
+
+        ra1 = radians(ra)
+        ra2 = radians(tra)
+        dec1 = radians(dec)
+        dec2 = radians(tdec)
+
+        deltaRA = 0.5 * (ra1 - ra2)     # delta longitude
+        deltaDEC = 0.5 * (dec1 - dec2)  # delta latitude
+
+        return 2 * arcsin(minimum(1.0, sqrt(sin(deltaDEC)**2 + cos(dec1) * cos(dec2) * sin(deltaRA)**2)))
+
+# End of pccatalog class definition
+
+def spreadBits(values):
+    """
+
+    Moves bit k of each value (of at most 32 bits) to bit 2k.
+
+    """
+
+    values = values.astype(numpy.uint64)
+
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)):
+        values = (values | (values << numpy.uint64(shift))) & numpy.uint64(mask)
+
+    return values
+
+def mortonIndex(ra, sdec, bits = 16):
+    """
+
+    Calculates the Morton (Z-order) index of sky positions. The ra in
+    degrees and the sine of the declination are each quantized on
+    2^bits levels, which makes the grid cells of equal area, and the
+    bits of the two cell numbers are interleaved.
+
+    INPUTS: Arrays of ra in degrees and sin(dec), bits per coordinate
+    (at most 32)
+
+    OUTPUTS: Array of unsigned 64 bit indices
+
+    """
+
+    levels = float(1 << bits)
+
+    x = numpy.clip(numpy.floor((numpy.asarray(ra) % 360.0) / 360.0 * levels), 0, levels - 1)
+    y = numpy.clip(numpy.floor(0.5 * (numpy.asarray(sdec) + 1.0) * levels), 0, levels - 1)
+
+    return spreadBits(x) | (spreadBits(y) << numpy.uint64(1))
+
+# Helpers for the precompute method, at module level so that they can be
+# sent to the processes of a pool.
+
+def precomputeChunk(cls, text, columns):
+    """
+
+    Creates the catalog for a block of columns. For text output, the
+    catalog is returned as gzip'd text.
+
+    """
+
+    catalog = cls.create(*columns)
+
+    if not text:
+        return catalog
+
+    output = io.BytesIO()
+
+    with GzipFile(fileobj=output, mode='wb') as compressed:
+        compressed.write(catalog.toText().encode("utf-8"))
+
+    return output.getvalue()
+
+def writeChunk(outfile, result):
+    """
+
+    Writes the result of precomputeChunk to its own file.
+
+    """
+
+    if isinstance(result, pccatalog):
+        result.write(outfile)
+
+    else:
+        with open(outfile, 'wb') as output:
+            output.write(result)
+
+# Test Code
+
+if __name__ == '__main__':
+
+    catalog = pccatalog.create([10, 11, 12], [10, 11, 12])
+
+    print(catalog)
+    print(catalog[0])
+    print(catalog[1:].ra, catalog[1:].ra.base is catalog.ra)
+    print(catalog[0].pcAngularDistance(catalog[1]))
@@ -34,6 +34,8 @@
 from math import sin, cos, asin, acos, radians, degrees, sqrt
 from gzip import GzipFile
 
+from .catalogio import readColumns, isBinary, readBinary, writeBinary, checkHeader
+
 class pcsource:
     
     """
@@ -355,50 +357,52 @@ class pcsource:
     
         sources = []
 
-        racol = int(raColumn)
-        deccol = int(decColumn)
-        
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
+        # The columns are parsed in large blocks by NumPy, only the
+        # precomputed quantities are calculated source by source.
 
-        try: # For the Finally clause
-            
-            try: # For the except clause
+        try:
+            ras, decs = readColumns(infile, (raColumn, decColumn), filterFunction)
 
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-            
-                for line in input:
+        except IOError:
+            print("ERROR: Could not read succesfully from ", infile)
+            return sources
 
-                    if (line.startswith('#') == False):
-            
-                        cols = line.split()
+        for ra, dec in zip(ras.tolist(), decs.tolist()):
+            sources.append(pcsource.create(ra, dec))
+                
+        return sources
 
-                        if filterFunction == None or filterFunction(cols):
-                            
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
+    def iterSources(infile, raColumn = 0, decColumn = 1, filterFunction = None,
+                    batchSize = 1 << 16):
+        """
 
-                            sources.append(pcsource.create(ra, dec))
+        The streaming version of createSources. Instead of a list of
+        source objects, it generates columnar catalogs (pccatalog) of
+        batchSize sources, so that the memory used does not depend on
+        the size of the file. Binary catalog files (.pcbin) are read
+        batch by batch as well.
 
-            except IOError:
-                print("ERROR: Could not read succesfully from ", infile)
-                        
-        finally:
-            input.close()
-                
-        return sources
+        INPUTS: Filename (plain, .gz or .pcbin) containing right
+        ascension, declination pairs, column ordinal numbers,
+        filter function, number of sources per batch
+
+        OUTPUTS: Generates catalogs
+
+        """
+
+        from .pccatalog import pccatalog
+
+        if isBinary(infile):
+            return pccatalog.iterRead(infile, batchSize)
+
+        return pccatalog.iterCatalog(infile, raColumn, decColumn, filterFunction, batchSize)
 
     def readSources(cls, infile):
         """
     
         Creates a new list of source objects from specially formatted,
-        gzip'd file.
+        gzip'd file, or from a binary catalog file (see catalogio) if
+        the filename ends with .pcbin.
         
         INPUTS: Filename containing sources with no .gz extension
         
@@ -418,6 +422,19 @@ class pcsource:
         """
     
         sources = []
+
+        # Binary catalog files hold the columns as arrays, so there is
+        # nothing to parse.
+
+        if isBinary(infile):
+            header, columns = readBinary(infile)
+
+            checkHeader(header, cls.__slots__, getattr(cls, 'cd', None))
+
+            for values in zip(*[columns[name].tolist() for name in cls.__slots__]):
+                sources.append(cls(*values))
+
+            return(sources)
     
         # In Python 2.5 the wrapper try block is not needed, but for
         # those who have not yet upgraded, this hack is required.
@@ -452,7 +469,9 @@ class pcsource:
         """
     
         Writes a list of source objects to specified compressed file using
-        a specially format.
+        a specially format. If the filename ends with .pcbin, a binary
+        catalog file (see catalogio) is written instead, which keeps
+        the full precision and can be memory mapped.
         
         INPUTS: Source list and Filename (with no .gz extension)
         
@@ -471,6 +490,21 @@ class pcsource:
                     
         """
     
+        # Binary catalog files are written column by column, with the
+        # columns in the order of the constructor arguments.
+
+        if isBinary(outfile):
+            attributes = {"class": cls.__name__}
+
+            if hasattr(cls, 'cd'):
+                attributes["cosmology"] = cls.cd.parameters()
+
+            writeBinary(outfile, cls.__slots__,
+                        [[getattr(source, name) for source in sources] for name in cls.__slots__],
+                        attributes)
+
+            return None
+
         # In Python 2.5 the wrapper try block is not needed, but for
         # those who have not yet upgraded, this hack is required.
 
@@ -487,7 +521,7 @@ class pcsource:
                 output = GzipFile(outfile, 'wb')
 
                 for source in sources:
-                    output.write(repr(source) + "\n")
+                    output.write((repr(source) + "\n").encode("utf-8"))
 
             except IOError:
                 print("ERROR: Could not write succesfully to ", outfile)
@@ -500,10 +534,16 @@ class pcsource:
     # Note that we can't use filter as that is a Python keyword, hence the
     # lengthy use of filterFunction.
 
-    def precomputeSources(infile, outfile, raColumn = 0, decColumn = 1, filterFunction = None):
+    def precomputeSources(infile, outfile, raColumn = 0, decColumn = 1, filterFunction = None,
+                          processes = 1, shards = False):
         """
         Creates a new file containing the precomputed data for sources
-        from a file containing right ascension, declination pairs.
+        from a file containing right ascension, declination pairs. If
+        the output filename ends with .pcbin, a binary catalog file is
+        written. With processes other than one, the input is split
+        into blocks computed by a pool of processes (None for all the
+        processors) and the filter function must be picklable; with
+        shards, each block is written to its own file.
         
         INPUTS: Input filename, Output filename, ra/dec column ordinal
         numbers, filter function.
@@ -518,51 +558,18 @@ class pcsource:
         class method.
         
         """
-            
-        racol = int(raColumn)
-        deccol = int(decColumn)
-          
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
-        
-        try: # For the Finally clause
-            
-            try: # For the except clause
 
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-        
-                # If outfile does not end with .gz, we add it on to the filename
-        
-                if outfile.endswith(".gz") == False:
-                    outfile += ".gz"
-                
-                output = GzipFile(outfile, 'wb')
-
-                for line in input:
-                
-                    if (line.startswith('#') == False):
-                
-                        cols = line.split()
-            
-                        if filterFunction == None or filterFunction(cols):
+        # The input is parsed, and the sources computed and written, a
+        # whole block of lines at a time (see pccatalog.precompute); a
+        # single process does it all by default.
 
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
+        from .pccatalog import pccatalog
 
-                            output.write(repr(pcsource.create(ra, dec)) + "\n")
+        try:
+            pccatalog.precompute(infile, outfile, (raColumn, decColumn), filterFunction, processes, shards)
 
-            except IOError:
-                print("ERROR: IO problem when reading or writing from specified files.")
-                        
-        finally:
-            input.close()
-            output.close()
+        except IOError:
+            print("ERROR: IO problem when reading or writing from specified files.")
 
     # This is the magic statement to make the methods true "class methods"
 
@@ -572,6 +579,7 @@ class pcsource:
     # This is the magic statement to make the methods true "static methods"
 
     createSources = staticmethod(createSources)
+    iterSources = staticmethod(iterSources)
     precomputeSources = staticmethod(precomputeSources)
     
 # End of pcsource class definition
@@ -0,0 +1,207 @@
+# pczcatalog.py
+#
+# This file contains the pczcatalog and pczcatalogjk classes, the
+# columnar counterparts of the pczsource and pczsourcejk classes. They
+# add the redshift, the line-of-sight comoving distance and the
+# jackknife number columns to the pccatalog columns.
+#
+
+import numpy
+from numpy import radians, sin, cos, asarray, zeros
+
+from .pccatalog import pccatalog
+from .pczsource import pczsource
+from .pczsourcejk import pczsourcejk
+
+class pczcatalog(pccatalog):
+    """
+
+    This class represents the spatial coordinates of a catalog of
+    sources, and as such it inherits the angular columns from the
+    pccatalog class.
+
+    """
+
+    columns = ('ra', 'dec', 'z', 'sra', 'cra', 'sdec', 'cdec', 'loscd')
+    sourceClass = pczsource
+
+    textFormat = "%13.10f % 13.10f %6.4f %14.12f %14.12f %14.12f %14.12f %15.10f"
+
+    def __init__(self, ra, dec, z, sra, cra, sdec, cdec, loscd):
+
+        self.setColumns((ra, dec, z, sra, cra, sdec, cdec, loscd))
+
+    def comovingDistances(z):
+        """
+
+        Calculates the line-of-sight comoving distance for an array of
+        redshifts with the cosmology shared by all pczsource objects,
+        from its comoving distance table (see cdistance.buildTable).
+
+        INPUTS: Array of redshifts
+
+        OUTPUTS: Array of comoving distances in units of h^{-1} Mpc
+
+        """
+
+        return pczsource.cd.dm(asarray(z, dtype=numpy.float64))
+
+    def create(cls, ra, dec, z):
+        """
+
+        This class method converts arrays of ra/dec/z tuples into a
+        catalog, by computing the precomputed quantities for all the
+        sources at once.
+
+        INPUTS: Arrays (or sequences) of ra and dec in degrees and z
+
+        OUTPUTS: A new catalog
+
+        """
+
+        ra = asarray(ra, dtype=numpy.float64)
+        dec = asarray(dec, dtype=numpy.float64)
+        z = asarray(z, dtype=numpy.float64)
+
+        rra = radians(ra)
+        rdec = radians(dec)
+
+        return(cls(ra, dec, z, sin(rra), cos(rra), sin(rdec), cos(rdec),
+                   cls.comovingDistances(z)))
+
+    def createCatalog(cls, infile, raColumn = 0, decColumn = 1, zColumn = 2, filterFunction = None,
+                      processes = 1, reorder = None):
+        """
+
+        Creates a new catalog from a file containing right ascension,
+        declination, redshift tuples.
+
+        INPUTS: Filename (plain or .gz) or file object, ra/dec/z
+        column ordinal numbers, filter function, number of processes
+        (None for all the processors), optional spatial order for the
+        sources (see pccatalog.reorder)
+
+        OUTPUTS: A new catalog
+
+        """
+
+        return cls.createFromColumns(infile, (raColumn, decColumn, zColumn), filterFunction, processes,
+                                     reorder)
+
+    def iterCatalog(cls, infile, raColumn = 0, decColumn = 1, zColumn = 2, filterFunction = None,
+                    batchSize = 1 << 16):
+        """
+
+        The streaming version of createCatalog, which generates the
+        catalog in batches of batchSize sources.
+
+        INPUTS: As for createCatalog, number of sources per batch
+
+        OUTPUTS: Generates catalogs of batchSize sources (the last one
+        may be shorter)
+
+        """
+
+        return cls.iterFromColumns(infile, (raColumn, decColumn, zColumn), filterFunction, batchSize)
+
+    comovingDistances = staticmethod(comovingDistances)
+    create = classmethod(create)
+    createCatalog = classmethod(createCatalog)
+    iterCatalog = classmethod(iterCatalog)
+
+    def comovingCartesian(self):
+        """
+
+        Returns the comoving positions of all the sources as an (n, 3)
+        array of X, Y, Z coordinates in units of h^{-1} Mpc, the unit
+        vectors scaled by the line-of-sight comoving distances. As for
+        pczsource.pcComovingDistance2, a flat universe is assumed.
+
+        """
+
+        return self.cartesian() * self.loscd[:, numpy.newaxis]
+
+# End of pczcatalog class definition
+
+class pczcatalogjk(pczcatalog):
+    """
+
+    This class represents the spatial coordinates of a catalog of
+    sources along with their jackknife numbers.
+
+    """
+
+    columns = ('ra', 'dec', 'z', 'sra', 'cra', 'sdec', 'cdec', 'loscd', 'jk')
+    sourceClass = pczsourcejk
+
+    # The jackknife number is appended to the pczsource text format
+
+    textFormat = pczcatalog.textFormat + " %d"
+
+    def __init__(self, ra, dec, z, sra, cra, sdec, cdec, loscd, jk):
+
+        self.setColumns((ra, dec, z, sra, cra, sdec, cdec, loscd, jk))
+
+    def columnType(name):
+        """
+
+        The jackknife number is an integer, all other columns are
+        double precision.
+
+        """
+
+        if name == 'jk':
+            return numpy.int64
+
+        return numpy.float64
+
+    def create(cls, ra, dec, z, jk = None):
+        """
+
+        This class method converts arrays of ra/dec/z tuples, and
+        optionally jackknife numbers, into a catalog. Without
+        jackknife numbers every source is put in region zero.
+
+        INPUTS: Arrays (or sequences) of ra and dec in degrees, z and
+        jackknife number
+
+        OUTPUTS: A new catalog
+
+        """
+
+        catalog = pczcatalog.create(ra, dec, z)
+
+        if jk is None:
+            jk = zeros(len(catalog), dtype=numpy.int64)
+
+        return(cls(*([getattr(catalog, name) for name in pczcatalog.columns] + [jk])))
+
+    def fromCatalog(cls, catalog, tree):
+        """
+
+        Creates a catalog with jackknife numbers from a pczcatalog,
+        assigning every source to its region of a jackknife tree.
+
+        INPUTS: A pczcatalog, a jackknife tree (jkFlatTree)
+
+        OUTPUTS: A new catalog
+
+        """
+
+        return(cls(*([getattr(catalog, name) for name in pczcatalog.columns] + [tree.assign(catalog)])))
+
+    columnType = staticmethod(columnType)
+    create = classmethod(create)
+    fromCatalog = classmethod(fromCatalog)
+
+# End of pczcatalogjk class definition
+
+# Test Code
+
+if __name__ == '__main__':
+
+    catalog = pczcatalog.create([10, 11], [10, 11], [0.1, 0.2])
+
+    print(catalog)
+    print(catalog[0].pcComovingDistance(catalog[1]))
+    print(pczcatalogjk.create([10, 11], [10, 11], [0.1, 0.2], [3, 4])[1])
@@ -12,7 +12,8 @@
 #
 
 from math import sin, cos, asin, acos, radians, degrees, sqrt
-from gzip import GzipFile
+
+from .catalogio import readColumns, isBinary
 
 from .pcsource import pcsource
 from .cdistance import cdistance
@@ -245,55 +246,59 @@ class pczsource(pcsource):
     
         sources = []
 
-        racol = int(raColumn)
-        deccol = int(decColumn)
-        zcol = int(zColumn)
-        
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
+        # The columns are parsed in large blocks by NumPy, only the
+        # precomputed quantities are calculated source by source.
 
-        try: # For the Finally clause
-            
-            try: # For the except clause
+        try:
+            ras, decs, zs = readColumns(infile, (raColumn, decColumn, zColumn), filterFunction)
 
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-            
-                for line in input:
+        except IOError:
+            print("ERROR: Could not read succesfully from ", infile)
+            return sources
+
+        for ra, dec, z in zip(ras.tolist(), decs.tolist(), zs.tolist()):
+            sources.append(pczsource.create(ra, dec, z))
+                
+        return sources
 
-                    if (line.startswith('#') == False):
-            
-                        cols = line.split()
+    def iterSources(infile, raColumn = 0, decColumn = 1, zColumn = 2, filterFunction = None,
+                    batchSize = 1 << 16):
+        """
 
-                        if filterFunction == None or filterFunction(cols):
+        The streaming version of createSources. Instead of a list of
+        source objects, it generates columnar catalogs (pczcatalog) of
+        batchSize sources, so that the memory used does not depend on
+        the size of the file. Binary catalog files (.pcbin) are read
+        batch by batch as well.
 
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
-                            z = float(cols[zcol])
-                            
-                            sources.append(pczsource.create(ra, dec, z))
+        INPUTS: Filename (plain, .gz or .pcbin) containing right
+        ascension, declination, redshift tuples, column ordinal
+        numbers, filter function, number of sources per batch
 
-            except IOError:
-                print("ERROR: Could not read succesfully from ", infile)
-                        
-        finally:
-            input.close()
-                
-        return sources
+        OUTPUTS: Generates catalogs
+
+        """
+
+        from .pczcatalog import pczcatalog
+
+        if isBinary(infile):
+            return pczcatalog.iterRead(infile, batchSize)
+
+        return pczcatalog.iterCatalog(infile, raColumn, decColumn, zColumn, filterFunction, batchSize)
     
     # Note that we can't use filter as that is a Python keyword, hence the
     # lengthy use of filterFunction.
 
     def precomputeSources(infile, outfile, raColumn = 0, decColumn = 1, zColumn = 2,
-                          filterFunction = None):
+                          filterFunction = None, processes = 1, shards = False):
         """
         Creates a new file containing the precomputed data for sources
-        from a file containing right ascension, declination pairs.
+        from a file containing right ascension, declination pairs. If
+        the output filename ends with .pcbin, a binary catalog file is
+        written. With processes other than one, the input is split
+        into blocks computed by a pool of processes (None for all the
+        processors) and the filter function must be picklable; with
+        shards, each block is written to its own file.
         
         INPUTS: Input filename, Output filename, ra/dec/z column
         ordinal numbers, filter function.
@@ -308,57 +313,23 @@ class pczsource(pcsource):
         class method.
         
         """
-            
-        racol = int(raColumn)
-        deccol = int(decColumn)
-        zcol = int(zColumn)
-          
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
-        
-        try: # For the Finally clause
-            
-            try: # For the except clause
-
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-        
-                # If outfile does not end with .gz, we add it on to the filename
-        
-                if outfile.endswith(".gz") == False:
-                    outfile += ".gz"
-                
-                output = GzipFile(outfile, 'wb')
 
-                for line in input:
-                
-                    if (line.startswith('#') == False):
-                
-                        cols = line.split()
-            
-                        if filterFunction == None or filterFunction(cols):
-
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
-                            z = float(cols[zcol])
-                            
-                            output.write(repr(pczsource.create(ra, dec, z)) + "\n")
-
-            except IOError:
-                print("ERROR: IO problem when reading or writing from specified files.")
-                        
-        finally:
-            input.close()
-            output.close()
+        # The input is parsed, and the sources computed and written, a
+        # whole block of lines at a time (see pccatalog.precompute); a
+        # single process does it all by default.
+
+        from .pczcatalog import pczcatalog
+
+        try:
+            pczcatalog.precompute(infile, outfile, (raColumn, decColumn, zColumn), filterFunction, processes, shards)
+
+        except IOError:
+            print("ERROR: IO problem when reading or writing from specified files.")
 
     # Define as static methods.
     
     createSources = staticmethod(createSources)
+    iterSources = staticmethod(iterSources)
     precomputeSources = staticmethod(precomputeSources)
 
 # End of pczsource class definition
@@ -15,7 +15,8 @@
 #
 
 from math import sin, cos, asin, acos, radians, degrees, sqrt
-from gzip import GzipFile
+
+from .catalogio import readColumns
 
 from .pczsource import pczsource
 
@@ -35,18 +36,19 @@ class pczsourcejk(pczsource):
     def __init__(self, ra, dec, z, sra, cra, sdec, cdec, loscd, jk):
 
         pczsource.__init__(self, 
-	float(ra), float(dec), float(sra), float(cra), float(sdec), 
-	float(cdec), float(z), float(loscd))
+	float(ra), float(dec), float(z), float(sra), float(cra), 
+	float(sdec), float(cdec), float(loscd))
         
         # Now set the precomputed quantities
         
         self.jk = int(jk)
 
-    def create(ra, dec, z):
+    def create(ra, dec, z, jk = 0):
         """
         
         This static class method converts a ra/dec/z tuple in a string
-        of data into an actual instance of the appropriate class.
+        of data into an actual instance of the appropriate class. The
+        jackknife number defaults to region zero.
     
         v1.0 Robert J. Brunner, March 26, 2007
  
@@ -61,7 +63,7 @@ class pczsourcejk(pczsource):
 
         loscd = pczsource.cd.dm(z)
         
-        return(pczsource(ra, dec, z, sra, cra, sdec, cdec, loscd))
+        return(pczsourcejk(ra, dec, z, sra, cra, sdec, cdec, loscd, jk))
 
     def parse(cls, data, racol = 0, deccol = 1, zcol = 2):
         """
@@ -91,7 +93,11 @@ class pczsourcejk(pczsource):
 
         loscd = float(data[zcol + 5])
 
-        return(cls(ra, dec, z, sra, cra, sdec, cdec, loscd))
+        # The jackknife number is the last column (see __repr__)
+
+        jk = int(data[zcol + 6])
+
+        return(cls(ra, dec, z, sra, cra, sdec, cdec, loscd, jk))
 
     # This is the magic statement to make the methods true static methods
     
@@ -120,11 +126,15 @@ class pczsourcejk(pczsource):
         
         Removed precomputed quantities from output.
 
+        The jackknife number is appended to the pczsource format, as
+        in pczcatalogjk.textFormat, so that text files written from
+        either one can be read by both.
+
         """
         
-        return("%13.10f % 13.10f %6.4f %14.12f %14.12f %14.12f %14.12f %15.10f" %
+        return("%13.10f % 13.10f %6.4f %14.12f %14.12f %14.12f %14.12f %15.10f %d" %
                (self.ra, self.dec, self.z,
-                self.sra, self.cra, self.sdec, self.cdec, self.loscd))
+                self.sra, self.cra, self.sdec, self.cdec, self.loscd, self.jk))
 
     def createSources(infile, raColumn = 0, decColumn = 1, zColumn = 2, filterFunction = None):
         """
@@ -151,44 +161,18 @@ class pczsourcejk(pczsource):
     
         sources = []
 
-        racol = int(raColumn)
-        deccol = int(decColumn)
-        zcol = int(zColumn)
-        
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
+        # The columns are parsed in large blocks by NumPy, only the
+        # precomputed quantities are calculated source by source.
 
-        try: # For the Finally clause
-            
-            try: # For the except clause
+        try:
+            ras, decs, zs = readColumns(infile, (raColumn, decColumn, zColumn), filterFunction)
 
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-            
-                for line in input:
-
-                    if (line.startswith('#') == False):
-            
-                        cols = line.split()
-
-                        if filterFunction == None or filterFunction(cols):
-
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
-                            z = float(cols[zcol])
-                            
-                            sources.append(pczsource.create(ra, dec, z))
-
-            except IOError:
-                print("ERROR: Could not read succesfully from ", infile)
-                        
-        finally:
-            input.close()
+        except IOError:
+            print("ERROR: Could not read succesfully from ", infile)
+            return sources
+
+        for ra, dec, z in zip(ras.tolist(), decs.tolist(), zs.tolist()):
+            sources.append(pczsourcejk.create(ra, dec, z))
                 
         return sources
     
@@ -196,10 +180,12 @@ class pczsourcejk(pczsource):
     # lengthy use of filterFunction.
 
     def precomputeSources(infile, outfile, raColumn = 0, decColumn = 1, zColumn = 2,
-                          filterFunction = None):
+                          filterFunction = None, processes = 1, shards = False):
         """
         Creates a new file containing the precomputed data for sources
-        from a file containing right ascension, declination pairs.
+        from a file containing right ascension, declination pairs,
+        with every source in jackknife region zero. The output file
+        and the processes are as for pczsource.precomputeSources.
         
         INPUTS: Input filename, Output filename, ra/dec/z column
         ordinal numbers, filter function.
@@ -214,53 +200,18 @@ class pczsourcejk(pczsource):
         class method.
         
         """
-            
-        racol = int(raColumn)
-        deccol = int(decColumn)
-        zcol = int(zColumn)
-          
-        # In Python 2.5 the wrapper try block is not needed, but for
-        # those who have not yet upgraded, this hack is required.
-        
-        try: # For the Finally clause
-            
-            try: # For the except clause
 
-                # We open the file as a gzip'd file if suffix is .gz, else
-                # treat as a normal file
-        
-                if infile.endswith(".gz"):
-                    input = GzipFile(infile, 'rb')
-                else:
-                    input = open(infile)
-        
-                # If outfile does not end with .gz, we add it on to the filename
-        
-                if outfile.endswith(".gz") == False:
-                    outfile += ".gz"
-                
-                output = GzipFile(outfile, 'wb')
+        # The input is parsed, and the sources computed and written, a
+        # whole block of lines at a time (see pccatalog.precompute); a
+        # single process does it all by default.
 
-                for line in input:
-                
-                    if (line.startswith('#') == False):
-                
-                        cols = line.split()
-            
-                        if filterFunction == None or filterFunction(cols):
-
-                            ra = float(cols[racol])   # The longitude coordinate
-                            dec = float(cols[deccol])     # The latitude coordinate
-                            z = float(cols[zcol])
-                            
-                            output.write(repr(pczsource.create(ra, dec, z)) + "\n")
-
-            except IOError:
-                print("ERROR: IO problem when reading or writing from specified files.")
-                        
-        finally:
-            input.close()
-            output.close()
+        from .pczcatalog import pczcatalogjk
+
+        try:
+            pczcatalogjk.precompute(infile, outfile, (raColumn, decColumn, zColumn), filterFunction, processes, shards)
+
+        except IOError:
+            print("ERROR: IO problem when reading or writing from specified files.")
 
     # Define as static methods.
     
@@ -273,8 +224,8 @@ class pczsourcejk(pczsource):
 
 if __name__ == '__main__':
 
-    a = pczsource.create(10, 10, 0.1)
-    b = pczsource.create(11, 11, 0.2)
+    a = pczsourcejk.create(10, 10, 0.1, 3)
+    b = pczsourcejk.create(11, 11, 0.2, 4)
 
     print(a.pcComovingDistance(b))
     print(a.pcAngularDistance(b))
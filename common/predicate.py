@@ -0,0 +1,204 @@
+# predicate.py
+#
+# This file contains declarative column predicates, which can be given
+# to the catalog loaders in place of a filterFunction. Where a
+# filterFunction is a Python function called on the split columns of
+# every line, a predicate is evaluated by NumPy on whole parsed blocks
+# of columns, so selective cuts (magnitude ranges, redshift ranges,
+# sets of flags) cost almost nothing, and the rejected rows are dropped
+# before any precomputed quantity is calculated.
+#
+# Predicates are built from column objects, named by their ordinal
+# number in the input file, and combined with &, | and ~:
+#
+#   cut = (column(3) < 21.5) & column(2).between(0.1, 0.3)
+#   sources = pczsource.createSources(infile, filterFunction = cut)
+#
+
+import operator
+import numpy
+
+class predicate(object):
+    """
+
+    The class that represents all predicates on the columns of a text
+    catalog.
+
+    """
+
+    def columns(self):
+        """
+
+        Returns the set of column ordinal numbers used by the
+        predicate.
+
+        """
+
+        pass # Must be overridden in subclass
+
+    def evaluate(self, values):
+        """
+
+        Evaluates the predicate on a block of rows.
+
+        INPUTS: Dictionary of column ordinal number to array of values
+
+        OUTPUTS: Boolean array, True for the rows that are kept
+
+        """
+
+        pass # Must be overridden in subclass
+
+    def __and__(self, other):
+        return combination(numpy.logical_and, [self, other])
+
+    def __or__(self, other):
+        return combination(numpy.logical_or, [self, other])
+
+    def __invert__(self):
+        return negation(self)
+
+# Picklable names for the comparison operators, so that predicates can
+# be sent to the processes of a pool.
+
+comparisons = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+               '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+class comparison(predicate):
+    """The class representing the comparison of a column to a value"""
+
+    def __init__(self, column, symbol, value):
+        self.column = int(column)
+        self.symbol = symbol
+        self.value = value
+
+    def __repr__(self):
+        return "column(%d) %s %r" % (self.column, self.symbol, self.value)
+
+    def columns(self):
+        return set([self.column])
+
+    def evaluate(self, values):
+        return comparisons[self.symbol](values[self.column], self.value)
+
+class between(predicate):
+    """The class representing a closed range of values of a column"""
+
+    def __init__(self, column, low, high):
+        self.column = int(column)
+        self.low = low
+        self.high = high
+
+    def __repr__(self):
+        return "column(%d).between(%r, %r)" % (self.column, self.low, self.high)
+
+    def columns(self):
+        return set([self.column])
+
+    def evaluate(self, values):
+        value = values[self.column]
+
+        return (value >= self.low) & (value <= self.high)
+
+class isin(predicate):
+    """The class representing a set of allowed values of a column"""
+
+    def __init__(self, column, allowed):
+        self.column = int(column)
+        self.allowed = numpy.asarray(list(allowed), dtype=numpy.float64)
+
+    def __repr__(self):
+        return "column(%d).isin(%r)" % (self.column, self.allowed.tolist())
+
+    def columns(self):
+        return set([self.column])
+
+    def evaluate(self, values):
+        return numpy.isin(values[self.column], self.allowed)
+
+class combination(predicate):
+    """The class representing the and/or of several predicates"""
+
+    def __init__(self, function, predicates):
+        self.function = function
+        self.predicates = predicates
+
+    def __repr__(self):
+        symbol = " & " if self.function is numpy.logical_and else " | "
+
+        return "(" + symbol.join([repr(item) for item in self.predicates]) + ")"
+
+    def columns(self):
+        return set().union(*[item.columns() for item in self.predicates])
+
+    def evaluate(self, values):
+        result = self.predicates[0].evaluate(values)
+
+        for item in self.predicates[1:]:
+            result = self.function(result, item.evaluate(values))
+
+        return result
+
+class negation(predicate):
+    """The class representing the negation of a predicate"""
+
+    def __init__(self, item):
+        self.item = item
+
+    def __repr__(self):
+        return "~" + repr(self.item)
+
+    def columns(self):
+        return self.item.columns()
+
+    def evaluate(self, values):
+        return numpy.logical_not(self.item.evaluate(values))
+
+class column(object):
+    """
+
+    The class representing a column of the input file, used to build
+    predicates with comparison operators.
+
+    """
+
+    def __init__(self, ordinal):
+        self.ordinal = int(ordinal)
+
+    def __lt__(self, value):
+        return comparison(self.ordinal, '<', value)
+
+    def __le__(self, value):
+        return comparison(self.ordinal, '<=', value)
+
+    def __gt__(self, value):
+        return comparison(self.ordinal, '>', value)
+
+    def __ge__(self, value):
+        return comparison(self.ordinal, '>=', value)
+
+    def __eq__(self, value):
+        return comparison(self.ordinal, '==', value)
+
+    def __ne__(self, value):
+        return comparison(self.ordinal, '!=', value)
+
+    __hash__ = None
+
+    def between(self, low, high):
+        return between(self.ordinal, low, high)
+
+    def isin(self, allowed):
+        return isin(self.ordinal, allowed)
+
+# Test Code
+
+if __name__ == '__main__':
+
+    cut = (column(2) < 0.5) & ~column(0).isin([1, 2]) | column(1).between(3, 4)
+
+    print(cut)
+    print(sorted(cut.columns()))
+    print(cut.evaluate({0: numpy.array([1.0, 5.0, 6.0]),
+                        1: numpy.array([3.5, 0.0, 0.0]),
+                        2: numpy.array([0.9, 0.1, 0.9])}))
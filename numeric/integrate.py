@@ -7,8 +7,64 @@
 #
 # March 5, 2007
 #
+# The romberg, gaussLegendre and adaptiveSimpson classes share the same
+# integrate(start, end) interface, and converge much faster than the
+# extended trapezoid rule for smooth integrands such as 1/E(z). All of
+# them take the relative tolerance as an optional epsilon argument.
+#
+# With vectorized = True the integrand is called once per refinement
+# (or panel set) with a NumPy array of abscissae, instead of once per
+# point. The state of an integration is kept in an integrationState
+# local to the integrate call, so one integrator object can be used by
+# several threads, or for nested integrals, at once.
+#
+# integrateMany(start, ends) returns the integrals from one lower limit
+# to a whole array of upper limits in one cumulative pass: the limits
+# are sorted into a single grid, each interval of the grid is
+# integrated once (to tolerance), and the results are summed.
+#
 
 from functools import reduce
+import numpy
+from numpy.polynomial.legendre import leggauss
+
+class integrationState:
+
+    """
+    The iteration state of one extended trapezoid integration.
+    """
+
+    def __init__(self, start, end):
+
+        self.start = float(start)
+        self.end = float(end)
+
+        self.numPoints = 0  # Number of points to sample function on next iteration
+        self.result = trapezoid.initialResult  # Current value of integral
+
+def cumulative(start, ends, intervals):
+
+    """
+    Integrates from one lower limit to many upper limits, by
+    integrating each interval between consecutive distinct limits only
+    once and accumulating the results.
+
+    INPUTS: The lower limit, array of upper limits, function returning
+    the array of integrals over the intervals given by arrays of their
+    starts and ends
+
+    OUTPUTS: Array of integrals, of the same shape as the upper limits
+    """
+
+    ends = numpy.asarray(ends, dtype=numpy.float64)
+
+    points, inverse = numpy.unique(numpy.concatenate(([float(start)], ends.ravel())),
+                                   return_inverse=True)
+    inverse = inverse.ravel()
+
+    sums = numpy.concatenate(([0.0], numpy.cumsum(intervals(points[:-1], points[1:]))))
+
+    return (sums[inverse[1:]] - sums[inverse[0]]).reshape(ends.shape)
 
 class trapezoid:
     
@@ -22,8 +78,13 @@ class trapezoid:
     epsilon = 1E-6
     maxIterations = 25
     
-    def __init__(self, integrand):
+    def __init__(self, integrand, epsilon = None, vectorized = False):
         
+        if epsilon is not None:
+            self.epsilon = float(epsilon)  # Relative tolerance, else the class default
+
+        self.vectorized = vectorized  # Whether the integrand takes arrays of abscissae
+
         self.numPoints = 0  # Number of points to sample function on next iteration
         self.result = trapezoid.initialResult  # Current value of integral
 
@@ -55,18 +116,15 @@ class trapezoid:
         if start == end: result = 0.0
         
         else:
-            self.numPoints = 0   
-            
-            self.start = float(start)
-            self.end = float(end)
+            state = integrationState(start, end)
             
             oldResult = trapezoid.initialResult
             
-            for iteration in range(trapezoid.maxIterations):
+            for iteration in range(self.maxIterations):
                 
-                result = self.theWork(iteration)
+                result = self.theWork(iteration, state)
                 
-                if(abs(result - oldResult) < trapezoid.epsilon * abs(oldResult)):
+                if(abs(result - oldResult) < self.epsilon * abs(oldResult)):
                     break
                 
                 oldResult = result
@@ -77,35 +135,339 @@ class trapezoid:
                 
         return result
     
-    def theWork(self, iteration):
+    def theWork(self, iteration, state = None):
        
         """
         Does the real work by implementing the extended trapezoid rule.
         
-        INPUTS: A 
+        INPUTS: The iteration number, and the integrationState to
+        refine (this object itself, as in the original interface, if
+        none is given)
         
-        OUTPUTS: The 
+        OUTPUTS: The refined estimate of the integral
         
         v1.0 Robert J. Brunner, March 5, 2007    
         """
         
+        if state is None:
+            state = self
+
         if(iteration == 0):
-            self.numPoints = 1
-            self.result = 0.5 * (self.end - self.start) * \
-                          (self.integrand(self.start) + self.integrand(self.end))
+            state.numPoints = 1
+            state.result = 0.5 * (state.end - state.start) * \
+                           self.sample([state.start, state.end])
 
         elif (iteration > 0):
-            delta = (self.end - self.start) / self.numPoints
+            delta = (state.end - state.start) / state.numPoints
             
-            sum = reduce(lambda x, y: x + y, \
-                         [self.integrand(self.start + 0.5 * delta + i * delta) \
-                          for i in range(self.numPoints)])
+            sum = self.sample(state.start + 0.5 * delta + delta * numpy.arange(state.numPoints))
             
-            self.result = 0.5 * (self.result + (self.end - self.start) * sum / self.numPoints)
+            state.result = 0.5 * (state.result + (state.end - state.start) * sum / state.numPoints)
             
-            self.numPoints *= 2
+            state.numPoints *= 2
+
+        return state.result
+
+    def sample(self, points):
+
+        """
+        Sums the integrand over a set of abscissae, with a single call
+        of the integrand in the vectorized mode.
+
+        INPUTS: Sequence or array of abscissae
+
+        OUTPUTS: The sum of the integrand values
+        """
+
+        if self.vectorized:
+            return float(numpy.sum(self.integrand(numpy.asarray(points, dtype=numpy.float64))))
+
+        return reduce(lambda x, y: x + y, [self.integrand(float(x)) for x in points])
+
+    def integrateMany(self, start, ends):
+
+        """
+        Calculates the integrals from one lower limit to many upper
+        limits, see cumulative.
+
+        INPUTS: The lower limit, array of upper limits
+
+        OUTPUTS: Array of integrals
+        """
+
+        return cumulative(start, ends, lambda starts, ends: numpy.array(
+            [self.integrate(a, b) for a, b in zip(starts, ends)], dtype=numpy.float64))
+
+class romberg(trapezoid):
+
+    """
+    Romberg integration: the successive extended trapezoid estimates of
+    theWork, with 1, 2, 4, ... intervals, are extrapolated to zero
+    interval width with Richardson's method, which removes one more
+    even power of the width from the error at every iteration.
+    """
+
+    epsilon = 1E-10
+    maxIterations = 20
+    minIterations = 4 # Guards against the early agreement of coarse estimates
+
+    def integrate(self, start, end):
+
+        """
+        Calculates the integral of the integrand between two limits.
+
+        INPUTS: The lower and upper limits
+
+        OUTPUTS: The integral
+        """
+
+        if start == end: return 0.0
+
+        state = integrationState(start, end)
+
+        rows = []
+
+        for iteration in range(self.maxIterations):
+
+            row = [self.theWork(iteration, state)]
+
+            for order in range(1, iteration + 1):
+                row.append(row[-1] + (row[-1] - rows[-1][order - 1]) / (4.0**order - 1.0))
+
+            if iteration >= self.minIterations and \
+               abs(row[-1] - rows[-1][-1]) <= self.epsilon * abs(row[-1]):
+                return row[-1]
+
+            rows.append(row)
+
+        print("Error, integration did not converge when using Romberg integration.")
+
+        return rows[-1][-1]
+
+class gaussLegendre:
+
+    """
+    Composite Gauss-Legendre integration with a fixed number of points
+    per panel. The number of panels is doubled, starting from one,
+    until two successive estimates agree.
+    """
+
+    epsilon = 1E-10
+    maxIterations = 16
+
+    def __init__(self, integrand, order = 20, epsilon = None, vectorized = False):
+
+        if epsilon is not None:
+            self.epsilon = float(epsilon)
+
+        self.integrand = integrand
+        self.vectorized = vectorized
+        self.order = int(order)
+
+        nodes, weights = leggauss(self.order)
+
+        self.nodes = nodes.tolist()
+        self.weights = weights.tolist()
+
+    def panels(self, start, end, count):
+
+        """
+        Applies the Gauss-Legendre rule on each of count equal panels.
+
+        INPUTS: The lower and upper limits, number of panels
+
+        OUTPUTS: The sum of the panel integrals
+        """
+
+        width = (end - start) / count
+
+        if self.vectorized:
+            middles = start + (numpy.arange(count) + 0.5) * width
+            values = self.integrand(middles[:, numpy.newaxis] + 0.5 * width * numpy.array(self.nodes))
+
+            return float(0.5 * width * numpy.sum(numpy.dot(values, self.weights)))
+
+        result = 0.0
+
+        for panel in range(count):
+            middle = start + (panel + 0.5) * width
 
-        return self.result
+            result += 0.5 * width * sum([weight * self.integrand(middle + 0.5 * width * node)
+                                         for node, weight in zip(self.nodes, self.weights)])
+
+        return result
+
+    def panelSets(self, starts, ends, count):
+
+        """
+        Applies the Gauss-Legendre rule on count equal panels of each
+        of many intervals, with one call of the integrand in the
+        vectorized mode.
+
+        INPUTS: Arrays of the lower and upper limits, number of panels
+
+        OUTPUTS: Array of the integrals over the intervals
+        """
+
+        widths = (ends - starts) / count
+        middles = starts[:, numpy.newaxis] + (numpy.arange(count) + 0.5) * widths[:, numpy.newaxis]
+
+        points = middles[:, :, numpy.newaxis] + 0.5 * widths[:, numpy.newaxis, numpy.newaxis] * \
+                 numpy.array(self.nodes)
+
+        if self.vectorized:
+            values = self.integrand(points)
+        else:
+            values = numpy.reshape([self.integrand(float(x)) for x in points.ravel()], points.shape)
+
+        return 0.5 * widths * numpy.dot(values, self.weights).sum(axis=1)
+
+    def intervals(self, starts, ends):
+
+        """
+        Integrates over many intervals at once, doubling the number of
+        panels of only those intervals that have not converged yet.
+
+        INPUTS: Arrays of the lower and upper limits
+
+        OUTPUTS: Array of integrals
+        """
+
+        starts = numpy.asarray(starts, dtype=numpy.float64)
+        ends = numpy.asarray(ends, dtype=numpy.float64)
+
+        results = self.panelSets(starts, ends, 1)
+        active = numpy.arange(len(results))
+
+        for iteration in range(1, self.maxIterations):
+            if not active.size:
+                return results
+
+            refined = self.panelSets(starts[active], ends[active], 2**iteration)
+            converged = numpy.abs(refined - results[active]) <= self.epsilon * numpy.abs(refined)
+
+            results[active] = refined
+            active = active[~converged]
+
+        if active.size:
+            print("Error, integration did not converge when using Gauss-Legendre integration.")
+
+        return results
+
+    def integrateMany(self, start, ends):
+
+        """
+        Calculates the integrals from one lower limit to many upper
+        limits, see cumulative. All the intervals are refined together.
+
+        INPUTS: The lower limit, array of upper limits
+
+        OUTPUTS: Array of integrals
+        """
+
+        return cumulative(start, ends, self.intervals)
+
+    def integrate(self, start, end):
+
+        """
+        Calculates the integral of the integrand between two limits.
+
+        INPUTS: The lower and upper limits
+
+        OUTPUTS: The integral
+        """
+
+        if start == end: return 0.0
+
+        start = float(start)
+        end = float(end)
+
+        oldResult = self.panels(start, end, 1)
+
+        for iteration in range(1, self.maxIterations):
+            result = self.panels(start, end, 2**iteration)
+
+            if abs(result - oldResult) <= self.epsilon * abs(result):
+                return result
+
+            oldResult = result
+
+        print("Error, integration did not converge when using Gauss-Legendre integration.")
+
+        return oldResult
+
+class adaptiveSimpson:
+
+    """
+    Adaptive Simpson integration: an interval is split in two until
+    Simpson's rule on the halves agrees with Simpson's rule on the
+    whole, to within a share of the tolerance proportional to the
+    width of the interval. The integrand values are reused between
+    levels, so every split costs two new evaluations.
+    """
+
+    epsilon = 1E-10
+    maxDepth = 50
+
+    def __init__(self, integrand, epsilon = None):
+
+        if epsilon is not None:
+            self.epsilon = float(epsilon)
+
+        self.integrand = integrand
+
+    def integrate(self, start, end):
+
+        """
+        Calculates the integral of the integrand between two limits.
+
+        INPUTS: The lower and upper limits
+
+        OUTPUTS: The integral
+        """
+
+        if start == end: return 0.0
+
+        start = float(start)
+        end = float(end)
+
+        f = self.integrand
+        fStart, fMiddle, fEnd = f(start), f(0.5 * (start + end)), f(end)
+
+        whole = (end - start) / 6.0 * (fStart + 4.0 * fMiddle + fEnd)
+
+        # An explicit stack of the intervals still to do, instead of
+        # recursion, so that the depth is not limited by Python
+
+        intervals = [(start, end, fStart, fMiddle, fEnd, whole, self.epsilon * abs(whole), 0)]
+        result = 0.0
+        converged = True
+
+        while intervals:
+            a, b, fa, fm, fb, whole, tolerance, depth = intervals.pop()
+
+            m = 0.5 * (a + b)
+            flm = f(0.5 * (a + m))
+            frm = f(0.5 * (m + b))
+
+            left = (m - a) / 6.0 * (fa + 4.0 * flm + fm)
+            right = (b - m) / 6.0 * (fm + 4.0 * frm + fb)
+            delta = left + right - whole
+
+            if abs(delta) <= 15.0 * tolerance or depth >= self.maxDepth:
+                converged = converged and depth < self.maxDepth
+                result += left + right + delta / 15.0
+
+            else:
+                intervals.append((a, m, fa, flm, fm, left, 0.5 * tolerance, depth + 1))
+                intervals.append((m, b, fm, frm, fb, right, 0.5 * tolerance, depth + 1))
+
+        if not converged:
+            print("Error, integration did not converge when using adaptive Simpson integration.")
+
+        return result
+
+    integrateMany = trapezoid.integrateMany
 
 def testfunc(x):
     return (x)
@@ -126,3 +488,14 @@ if __name__ == '__main__':
 
     print(3000.0 * (1 + float(0.558)) * t2.integrate(0.0, 0.558))
     print(2265.876909, "NW's tool",  2264.797863, "Romberg")
+
+    for routine in (romberg, gaussLegendre, adaptiveSimpson):
+        print(3000.0 * (1 + float(0.558)) * routine(testfunc2).integrate(0.0, 0.558), routine.__name__)
+
+    t3 = romberg(lambda x: 1.0 / numpy.sqrt(0.3 * (1.0 + x)**3 + 0.7), vectorized = True)
+
+    print(3000.0 * (1 + float(0.558)) * t3.integrate(0.0, 0.558), "vectorized romberg")
+
+    t4 = gaussLegendre(t3.integrand, vectorized = True)
+
+    print(3000.0 * t4.integrateMany(0.0, [0.1, 0.558, 1.0]), "comoving distances")
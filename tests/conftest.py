@@ -0,0 +1,34 @@
+# conftest.py
+#
+# The common and numeric packages use relative imports, so they are
+# imported as subpackages of the repository directory, whatever its
+# name, with its parent directory on the path.
+#
+
+import importlib
+import os
+import sys
+
+import pytest
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.dirname(repository))
+
+@pytest.fixture(autouse=True)
+def cacheDirectory(tmp_path, monkeypatch):
+    """Keeps the saved comoving distance tables out of ~/.cache/cosmo"""
+
+    directory = tmp_path / "cache"
+    monkeypatch.setenv("COSMO_CACHE_DIR", str(directory))
+
+    return directory
+
+@pytest.fixture
+def common():
+    """Returns a function importing a module of the common package by name"""
+
+    def load(name):
+        return importlib.import_module("%s.common.%s" % (os.path.basename(repository), name))
+
+    return load
@@ -0,0 +1,158 @@
+# test_bincount.py
+#
+# Smoke tests running the bincount scripts from their own directory,
+# as hadoop streaming does, with nothing else on the path.
+#
+
+import ast
+import os
+import subprocess
+import sys
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+directory = os.path.join(repository, "bincount")
+points = os.path.join(repository, "randomdata", "10line.in")
+
+def run(script, *arguments, **options):
+    environment = dict(os.environ)
+    environment.pop("PYTHONPATH", None)
+
+    return subprocess.run([sys.executable, script] + list(arguments), cwd=directory,
+                          env=environment, stdout=subprocess.PIPE, check=True,
+                          universal_newlines=True, **options).stdout
+
+def test_map_reduce_pipeline():
+    with open(points) as infile:
+        mapped = run("mapper.py", stdin=infile)
+
+    reduced = run("reducer.py", input=mapped)
+    counter = ast.literal_eval(run("combiner.py", input=reduced))
+
+    # Every ordered pair of the 10 points is counted once
+
+    assert sum(map(sum, counter)) == 10 * 10
+
+def test_bincount_script(tmp_path):
+    logfile = str(tmp_path / "counts")
+
+    output = run("bincount.py", points, logfile, stderr=subprocess.DEVNULL)
+
+    assert output.count("bin:") == 30
+
+    with open(logfile) as counts:
+        assert len(counts.read().split()) == 30
+
+def test_dec_strip_pairs():
+    import importlib
+    import numpy
+
+    decStripCount = importlib.import_module("%s.bincount.decStripCount" % os.path.basename(repository))
+
+    # A band straddling RA 0 and a cap around the north pole
+
+    generator = numpy.random.RandomState(7)
+    ras = numpy.concatenate([generator.uniform(-0.3, 0.3, 400), generator.uniform(0, 2 * numpy.pi, 200)])
+    decs = numpy.concatenate([generator.uniform(-0.3, 0.3, 400), generator.uniform(1.45, 0.5 * numpy.pi, 200)])
+    maxangle = 0.08
+
+    i, j = numpy.triu_indices(ras.size, 1)
+    cos_decs = numpy.cos(decs)
+    angles = decStripCount.haversine(ras[i], decs[i], cos_decs[i], ras[j], decs[j], cos_decs[j])
+    expected = numpy.sort(angles[angles <= maxangle])
+
+    for maxPairs in (1 << 20, 1000):
+        found = numpy.sort(decStripCount.decStripDistances(ras, decs, maxangle, maxPairs))
+        # The same pairs, up to the rounding of the wrapped RAs
+
+        assert found.size == expected.size
+        assert numpy.allclose(found, expected, rtol=1e-12, atol=1e-15)
+
+def test_count_pair_exact():
+    import importlib
+    import warnings
+    import numpy
+
+    bincount = importlib.import_module("%s.bincount.bincount" % os.path.basename(repository))
+    scale = 3600 * numpy.degrees(1.0)
+
+    def check(group0, group1):
+        expected = bincount.Bin(maxbin=36000, minbin=2, binNum=30)
+        with numpy.errstate(divide="ignore"):
+            expected.count(bincount.distancePair(*[tuple(column.copy() for column in group)
+                                                   for group in (group0, group1)]) * scale)
+
+        counted = bincount.Bin(maxbin=36000, minbin=2, binNum=30)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)
+            bincount.countPair(group0, group1, counted, scale)
+
+        assert numpy.array_equal(counted.counter, expected.counter)
+
+    generator = numpy.random.RandomState(11)
+    ras = numpy.radians(generator.uniform(10, 20, 600))
+    decs = numpy.radians(generator.uniform(-5, 5, 600))
+    blocks = list(zip(numpy.array_split(ras, 3), numpy.array_split(decs, 3)))
+
+    # Random blocks, and self blocks with their zero angles
+
+    check(blocks[0], blocks[1])
+    check(blocks[2], blocks[2])
+
+    # Pairs along a meridian a relative 1e-12 either side of every bin edge
+
+    mybin = bincount.Bin(maxbin=36000, minbin=2, binNum=30)
+    edges = numpy.exp(mybin.offset + mybin.size * numpy.arange(1, 30) / 30) / scale
+    steps = numpy.concatenate([edges * (1 - 1e-12), edges, edges * (1 + 1e-12)])
+    check((numpy.full(1, 0.3), numpy.full(1, 0.1)), (numpy.full(steps.size, 0.3), 0.1 + steps))
+
+def test_block_size_cache(cacheDirectory):
+    import importlib
+    import json
+
+    blockSize = importlib.import_module("%s.bincount.blockSize" % os.path.basename(repository))
+    calls = []
+
+    def kernel(group0, group1):
+        calls.append(group0[0].size)
+
+    size = blockSize.autoBlockSize(kernel, memoryLimit=1 << 24, candidates=(16, 32), name="test")
+
+    # The choice is saved under COSMO_CACHE_DIR, with no temporary left behind
+
+    assert os.listdir(str(cacheDirectory)) == ["blocksize.json"]
+    with open(str(cacheDirectory / "blocksize.json")) as infile:
+        assert list(json.load(infile).values()) == [size]
+
+    del calls[:]
+    assert blockSize.autoBlockSize(kernel, memoryLimit=1 << 24, candidates=(16, 32), name="test") == size
+    assert calls == []
+
+def test_bin_round_trip(tmp_path):
+    import importlib
+    import numpy
+    import pytest
+
+    bincount = importlib.import_module("%s.bincount.bincount" % os.path.basename(repository))
+
+    mybin = bincount.Bin(maxbin=3600, minbin=2, binNum=12)
+    mybin.count(numpy.geomspace(1, 5000, 200))
+
+    def same(other):
+        return other.config() == mybin.config() and numpy.array_equal(other.counter, mybin.counter)
+
+    assert same(bincount.Bin.fromBuffer(mybin.toBuffer()))
+
+    outfile = str(tmp_path / "bins.npy")
+    mybin.save(outfile)
+    assert same(bincount.Bin.load(outfile))
+
+    # Merging doubles the counts, but only between bins of the same edges
+
+    total = mybin + bincount.Bin.fromBuffer(mybin.toBuffer())
+    assert numpy.array_equal(total.counter, 2 * mybin.counter)
+
+    for other in (bincount.Bin(3600, 2, 13), bincount.Bin(7200, 2, 12), bincount.Bin(3600, 1, 12)):
+        with pytest.raises(ValueError):
+            mybin.merge(other)
+        with pytest.raises(ValueError):
+            mybin + other
@@ -0,0 +1,75 @@
+# test_catalogs.py
+#
+# Round trips between the source classes and the columnar catalogs.
+#
+
+import gzip
+
+def test_jackknife_text_round_trip(common, tmp_path):
+    pczsourcejk = common("pczsourcejk").pczsourcejk
+    pczcatalogjk = common("pczcatalog").pczcatalogjk
+
+    catalog = pczcatalogjk.create([10, 11, 12], [10, 11, -12], [0.1, 0.2, 0.3], [3, 4, 5])
+    lines = catalog.toText().splitlines()
+
+    # The catalog and the source objects write the same columns
+
+    assert lines == [repr(source) for source in catalog]
+
+    outfile = str(tmp_path / "sources")
+    pczsourcejk.writeSources(outfile, catalog.toSources())
+
+    sources = pczsourcejk.readSources(outfile)
+
+    assert [source.jk for source in sources] == [3, 4, 5]
+    assert [repr(source) for source in sources] == lines
+
+    batches = list(pczcatalogjk.iterRead(outfile))
+
+    assert len(batches) == 1
+    assert batches[0].jk.tolist() == [3, 4, 5]
+    assert batches[0].toText().splitlines() == lines
+
+    with gzip.open(outfile + ".gz", "rt") as text:
+        assert text.read().splitlines() == lines
+
+def test_precompute_predicate_serial_text(common, tmp_path):
+    pcsource = common("pcsource").pcsource
+    pczsource = common("pczsource").pczsource
+    pczsourcejk = common("pczsourcejk").pczsourcejk
+    column = common("predicate").column
+
+    infile = tmp_path / "input.txt"
+    infile.write_text("# ra dec z mag\n"
+                      "10.0 10.0 0.1 20.0\n"
+                      "11.0 11.0 0.2 22.0\n"
+                      "12.0 -12.0 0.3 21.0\n")
+
+    cut = (column(3) < 21.5) & (column(2) > 0.05)
+
+    for sourceClass in (pcsource, pczsource, pczsourcejk):
+        outfile = str(tmp_path / sourceClass.__name__)
+
+        sourceClass.precomputeSources(str(infile), outfile, filterFunction = cut)
+
+        sources = sourceClass.readSources(outfile)
+
+        assert [source.ra for source in sources] == [10.0, 12.0]
+        assert [repr(source) for source in sources] == \
+            [repr(source) for source in sourceClass.createSources(str(infile), filterFunction = cut)]
+
+def test_create_catalog_from_file_object(common, tmp_path):
+    pccatalog = common("pccatalog").pccatalog
+
+    infile = tmp_path / "input.txt"
+    infile.write_text("".join("%.1f %.1f\n" % (10 + index, index - 5) for index in range(10)))
+
+    expected = pccatalog.createCatalog(str(infile))
+
+    # A file object is read here and its blocks parsed by the pool
+
+    for processes in (1, 2):
+        with open(str(infile)) as text:
+            catalog = pccatalog.createCatalog(text, processes = processes)
+
+        assert catalog.toText() == expected.toText()
@@ -0,0 +1,59 @@
+# test_cdistance.py
+#
+# The comoving distance tables.
+#
+
+import os
+import stat
+
+import numpy
+
+def test_saved_table_permissions(common, cacheDirectory):
+    cdistance = common("cdistance").cdistance
+
+    umask = os.umask(0o022)
+
+    try:
+        cdistance(0.25, 0.75).dm(numpy.array([0.5]))
+    finally:
+        os.umask(umask)
+
+    names = os.listdir(str(cacheDirectory))
+
+    assert len(names) == 1
+    assert stat.S_IMODE(os.stat(str(cacheDirectory / names[0])).st_mode) == 0o644
+
+def direct(common, cd, z):
+    """Comoving distances integrated one redshift at a time"""
+
+    # The integrator of the table, with many more points per interval
+
+    quadrature = common("cdistance").gaussLegendre(cd.oneOverEvolutionArray, 20, 1E-13,
+                                                   vectorized = True)
+
+    return numpy.array([(3000.0 / cd.h0) * quadrature.integrate(0.0, value) for value in z])
+
+def test_table_error_bound(common):
+    cd = common("cdistance").cdistance()
+
+    z = numpy.random.RandomState(5).uniform(0.0, 5.0, 200)
+    distances = cd.dm(z)
+
+    assert cd.tableError < 1E-7
+    assert numpy.abs(distances - direct(common, cd, z)).max() <= cd.tableError
+
+def test_beyond_table_limit(common):
+    cd = common("cdistance").cdistance()
+
+    z = numpy.array([1100.0, 5000.0])
+
+    assert numpy.allclose(cd.dm(z), direct(common, cd, z), rtol = 1E-9, atol = 0.0)
+    assert abs(cd.dm(1100.0) - cd.dm(z)[0]) < 1E-9
+
+def test_redshift_inverse(common):
+    cd = common("cdistance").cdistance()
+
+    z = numpy.concatenate(([0.0, 1E-4, 1.0], numpy.random.RandomState(6).uniform(0.0, 20.0, 200)))
+
+    assert numpy.abs(cd.redshift(direct(common, cd, z)) - z).max() < 1E-9
+    assert abs(cd.redshift(cd.dm(0.843)) - 0.843) < 1E-9
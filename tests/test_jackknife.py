@@ -0,0 +1,62 @@
+# test_jackknife.py
+#
+# The flat jackknife tree against a recursive split written here.
+#
+
+import numpy
+
+def referenceRegions(positions, level):
+    """The jackknife number of every position, splitting each node at
+    the mean of the coordinate with the largest standard deviation"""
+
+    regions = numpy.zeros(len(positions), dtype=numpy.int64)
+
+    def split(rows, depth, first):
+        if depth == level:
+            regions[rows] = first
+            return
+
+        means = positions[rows].mean(axis=0)
+        (sigmaX, sigmaY, sigmaZ) = positions[rows].std(axis=0)
+
+        if sigmaX > sigmaY:
+            column = 0 if sigmaX > sigmaZ else 2
+        else:
+            column = 1 if sigmaY > sigmaZ else 2
+
+        below = positions[rows, column] < means[column]
+        half = 1 << (level - depth - 1)
+
+        split(rows[below], depth + 1, first)
+        split(rows[~below], depth + 1, first + half)
+
+    split(numpy.arange(len(positions)), 0, 0)
+
+    return regions
+
+class point:
+    def __init__(self, position):
+        self.position = position
+
+    def getCartesianValue(self, index):
+        return self.position[index]
+
+def test_flat_tree_regions(common):
+    jkFlatTree = common("jackknife").jkFlatTree
+
+    # Unit vectors of a patch of sky, wider in RA than in dec
+
+    generator = numpy.random.RandomState(3)
+    ra = numpy.radians(generator.uniform(20, 80, 2000))
+    dec = numpy.radians(generator.uniform(-10, 15, 2000))
+    positions = numpy.column_stack([numpy.cos(dec) * numpy.cos(ra), numpy.cos(dec) * numpy.sin(ra),
+                                    numpy.sin(dec)])
+
+    for level in (1, 3, 5):
+        tree = jkFlatTree(level, positions)
+        expected = referenceRegions(positions, level)
+
+        assert numpy.array_equal(tree.assign(positions), expected)
+        assert numpy.bincount(expected, minlength=1 << level).min() > 0
+        assert [tree.getJackknife(point(position)) for position in positions[::50]] == \
+            expected[::50].tolist()
@@ -0,0 +1,67 @@
+# test_paircount.py
+#
+# The cell-list pair counts against brute force.
+#
+
+import numpy
+
+def test_compact_angular_pair_counts(common):
+    pccatalog = common("pccatalog").pccatalog
+    pcvcatalog = common("pcqcatalog").pcvcatalog
+    paircount = common("paircount")
+
+    random = numpy.random.RandomState(7)
+    catalog = pccatalog.create(random.uniform(0, 20, 1500), random.uniform(-10, 10, 1500))
+    compact = pcvcatalog.fromCatalog(catalog)
+
+    edges = numpy.array([0.1, 0.5, 1.0, 2.0, 4.0])
+    chords = 2.0 * numpy.sin(0.5 * numpy.radians(edges))
+
+    # The brute force counts of the stored single precision vectors
+
+    vectors = numpy.column_stack((compact.x, compact.y, compact.z)).astype(numpy.float64)
+    upper = numpy.triu_indices(len(vectors), 1)
+    chord2 = ((vectors[:, numpy.newaxis, :] - vectors[numpy.newaxis, :, :])**2).sum(axis=-1)
+
+    expected = numpy.histogram(chord2[upper], chords**2)[0]
+
+    counts = paircount.angularPairCounts(compact, None, edges)
+
+    assert counts.tolist() == expected.tolist()
+    assert paircount.unitVectorsOf(compact).dtype == numpy.float32
+
+    # Counting the double precision catalog only moves pairs on the edges
+
+    assert numpy.abs(paircount.angularPairCounts(catalog, None, edges) - counts).sum() <= 2
+
+def test_pair_counts_of_streamed_catalogs(common, tmp_path):
+    pczsource = common("pczsource").pczsource
+    pczcatalogjk = common("pczcatalog").pczcatalogjk
+    paircount = common("paircount")
+
+    random = numpy.random.RandomState(11)
+    size = 800
+
+    catalog = pczcatalogjk.create(random.uniform(0, 5, size), random.uniform(0, 5, size),
+                                  random.uniform(0.1, 0.15, size), random.randint(0, 3, size))
+
+    infile = tmp_path / "points.txt"
+    numpy.savetxt(str(infile), numpy.column_stack((catalog.ra, catalog.dec, catalog.z)), fmt="%.12f")
+
+    binfile = str(tmp_path / "points.pcbin")
+    catalog.write(binfile)
+
+    edges = numpy.linspace(1.0, 10.0, 4)
+
+    expected = paircount.comovingPairCounts(catalog, None, edges)
+    streamed = paircount.comovingPairCounts(pczsource.iterSources(str(infile), batchSize = 100),
+                                            None, edges)
+
+    assert streamed["DD"].tolist() == expected["DD"].tolist()
+
+    expected = paircount.comovingPairCounts(catalog, None, edges, jackknife = True)
+    streamed = paircount.comovingPairCounts(pczcatalogjk.iterRead(binfile, 100),
+                                            None, edges, jackknife = True)
+
+    assert streamed["DD"].tolist() == expected["DD"].tolist()
+    assert streamed["ND"].tolist() == expected["ND"].tolist()